@@ -0,0 +1,100 @@
+import re
+
+ENTRY_TYPES = ("totp", "hotp", "steam", "motp", "yandex")
+ALGORITHMS = ("SHA1", "SHA256", "SHA512", "MD5")
+
+_ENTRIES_RE = re.compile(rb'"entries"\s*:\s*\[')
+_SEP_RE = re.compile(rb"[\s,]*")
+_SPECIAL_RE = re.compile(rb'[{}\[\]"]')
+
+class FormatError(Exception):
+    pass
+
+def iter_raw_entries(f, chunk_size=1 << 20, skeleton=None):
+    """Yields the raw JSON of every entry in the entries array of the given
+    binary file, which contains either a plain vault or a vault database. Only
+    the current entry and one chunk are kept in memory. If skeleton is a list,
+    the JSON of the document with an empty entries array is appended to it
+    once the end of the array is reached."""
+    buf = b""
+    while True:
+        m = _ENTRIES_RE.search(buf)
+        if m is not None:
+            break
+        chunk = f.read(chunk_size)
+        if not chunk:
+            raise FormatError("no entries array found (is the vault encrypted?)")
+        # keep a bit of the previous chunk in case the key was split in two
+        buf = (buf if skeleton is not None else buf[-64:]) + chunk
+
+    prefix = buf[:m.start()] if skeleton is not None else None
+    buf = buf[m.end():]
+    pos = 0
+    while True:
+        pos = _SEP_RE.match(buf, pos).end()
+        if pos >= len(buf):
+            chunk = f.read(chunk_size)
+            if not chunk:
+                raise FormatError("unexpected end of file in the entries array")
+            buf, pos = buf[pos:] + chunk, 0
+            continue
+
+        c = buf[pos]
+        if c == ord("]"):
+            if skeleton is not None:
+                skeleton.append(prefix + b'"entries": []' + buf[pos + 1:] + f.read())
+            return
+        if c != ord("{"):
+            raise FormatError("unexpected character {!r} in the entries array".format(chr(c)))
+
+        start = scan = pos
+        depth = 0
+        in_str = False
+        while True:
+            if in_str:
+                q = buf.find(b'"', scan)
+                if q != -1:
+                    # count the backslashes in front of the quote to see if it's escaped
+                    i = q - 1
+                    while buf[i] == ord("\\"):
+                        i -= 1
+                    scan = q + 1
+                    in_str = (q - 1 - i) % 2 == 1
+                    continue
+            else:
+                m = _SPECIAL_RE.search(buf, scan)
+                if m is not None:
+                    scan = m.end()
+                    c = buf[m.start()]
+                    if c == ord('"'):
+                        in_str = True
+                    elif c in (ord("{"), ord("[")):
+                        depth += 1
+                    else:
+                        depth -= 1
+                        if depth == 0:
+                            yield buf[start:scan]
+                            pos = scan
+                            break
+                    continue
+
+            chunk = f.read(chunk_size)
+            if not chunk:
+                raise FormatError("unexpected end of file in entry")
+            buf = buf[start:] + chunk
+            scan = len(buf) - len(chunk)
+            start = 0
+
+def icon_mime(data):
+    """Returns the MIME type of the given icon based on its contents, or None if
+    it isn't a PNG, JPEG, WebP or SVG image."""
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if data.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if data.startswith(b"RIFF") and data[8:12] == b"WEBP":
+        return "image/webp"
+    head = data[:1024].lstrip(b"\xef\xbb\xbf \t\r\n")
+    if head.startswith(b"<") and b"<svg" in data[:4096]:
+        return "image/svg+xml"
+    return None
@@ -0,0 +1,38 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def backends():
+    res = ["json"]
+    if orjson is not None:
+        res.append("orjson")
+    return res
+
+def dumps(obj, compact=False, backend=None) -> bytes:
+    """Serializes the given object to UTF-8 encoded JSON. The default output is
+    indented with 4 spaces. Compact output has no indentation or whitespace at
+    all and uses orjson if it's installed, unless a backend is given."""
+    if backend is None:
+        backend = "orjson" if compact and orjson is not None else "json"
+
+    if backend == "orjson":
+        if orjson is None:
+            raise ValueError("the orjson backend is not installed")
+        if not compact:
+            # orjson only supports an indentation of 2 spaces
+            return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+        return orjson.dumps(obj)
+    elif backend == "json":
+        if compact:
+            return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+        return json.dumps(obj, indent=4).encode("utf-8")
+
+    raise ValueError("unknown JSON backend: {}".format(backend))
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
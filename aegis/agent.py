@@ -0,0 +1,171 @@
+import asyncio
+import json
+import os
+import signal
+import socket
+import struct
+import tempfile
+import time
+
+SOCKET_ENV = "AEGIS_AGENT_SOCK"
+DEFAULT_TTL = 15 * 60
+
+class AgentError(Exception):
+    pass
+
+class KeyAgent:
+    """Keeps unwrapped vault master keys in memory, so that repeated decryptions
+    of the same vault don't have to run scrypt again, similar to ssh-agent.
+
+    Keys are indexed by slot identifier (see aegis.vault.slot_id) and expire
+    after their TTL. The agent listens on a Unix socket that only the current
+    user can access. Every request and response is a single line of JSON.
+    Without a path, the socket is created in a new temporary directory, which
+    is removed along with the socket when the agent stops."""
+
+    def __init__(self, path=None, ttl=DEFAULT_TTL):
+        self._dir = None
+        if path is None:
+            self._dir = tempfile.mkdtemp(prefix="aegis-agent-")
+            path = os.path.join(self._dir, "agent.sock")
+        self.path = path
+        self.ttl = ttl
+        self._keys = {}
+
+    async def serve_forever(self):
+        # only allow the current user to connect, regardless of the umask
+        old_umask = os.umask(0o177)
+        try:
+            server = await asyncio.start_unix_server(self._handle_conn, self.path)
+        finally:
+            os.umask(old_umask)
+        # remove the socket when the agent is killed as well
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+            if self._dir is not None:
+                os.rmdir(self._dir)
+            self._keys.clear()
+
+    def add(self, slot, key, ttl=None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        self._keys[slot] = (key, time.monotonic() + ttl)
+
+    def get(self, slots):
+        """Returns a (slot, key) tuple for the first of the given slots that has
+        a key that hasn't expired yet, or None."""
+        self._expire()
+        for slot in slots:
+            if slot in self._keys:
+                return slot, self._keys[slot][0]
+        return None
+
+    def _expire(self):
+        now = time.monotonic()
+        for slot in [slot for slot, (_, expiry) in self._keys.items() if expiry <= now]:
+            del self._keys[slot]
+
+    def _handle_request(self, req):
+        op = req.get("op")
+        if op == "get":
+            res = self.get(req["slots"])
+            if res is None:
+                return {"slot": None, "key": None}
+            return {"slot": res[0], "key": res[1].hex()}
+        if op == "add":
+            self.add(req["slot"], bytes.fromhex(req["key"]), ttl=req.get("ttl"))
+            return {}
+        if op == "list":
+            self._expire()
+            now = time.monotonic()
+            return {"slots": {slot: round(expiry - now) for slot, (_, expiry) in self._keys.items()}}
+        if op == "clear":
+            self._keys.clear()
+            return {}
+        raise AgentError("unknown operation: {}".format(op))
+
+    async def _handle_conn(self, reader, writer):
+        try:
+            # refuse connections of other users, in case the socket permissions are bypassed
+            sock = writer.get_extra_info("socket")
+            if hasattr(socket, "SO_PEERCRED"):
+                # struct ucred is the pid, uid and gid as native ints
+                creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+                if struct.unpack("3i", creds)[1] != os.getuid():
+                    return
+
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    res = self._handle_request(json.loads(line))
+                except (AgentError, KeyError, TypeError, ValueError) as e:
+                    res = {"error": str(e)}
+                writer.write(json.dumps(res).encode("utf-8") + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+class AgentClient:
+    """A blocking client for a KeyAgent."""
+
+    def __init__(self, path=None, timeout=5):
+        path = path or os.environ.get(SOCKET_ENV)
+        if not path:
+            raise AgentError("no agent socket given and {} is not set".format(SOCKET_ENV))
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.settimeout(timeout)
+        try:
+            self._sock.connect(path)
+        except OSError as e:
+            self._sock.close()
+            raise AgentError("unable to connect to the agent at {}: {}".format(path, e))
+        self._file = self._sock.makefile("rb")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._file.close()
+        self._sock.close()
+
+    def _request(self, req):
+        try:
+            self._sock.sendall(json.dumps(req).encode("utf-8") + b"\n")
+            line = self._file.readline()
+        except OSError as e:
+            raise AgentError("agent request failed: {}".format(e))
+        if not line:
+            raise AgentError("the agent closed the connection")
+        res = json.loads(line)
+        if "error" in res:
+            raise AgentError(res["error"])
+        return res
+
+    def get_key(self, slots):
+        """Returns a (slot, master_key) tuple for the first of the given slot
+        identifiers the agent has a key for, or None."""
+        res = self._request({"op": "get", "slots": list(slots)})
+        if res["key"] is None:
+            return None
+        return res["slot"], bytes.fromhex(res["key"])
+
+    def add_key(self, slot, key, ttl=None):
+        self._request({"op": "add", "slot": slot, "key": key.hex(), "ttl": ttl})
+
+    def list_keys(self):
+        """Returns a dict with the remaining lifetime in seconds of every key."""
+        return self._request({"op": "list"})["slots"]
+
+    def clear(self):
+        self._request({"op": "clear"})
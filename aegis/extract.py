@@ -0,0 +1,111 @@
+import binascii
+import hashlib
+import json
+import os
+import tempfile
+from base64 import b64decode
+
+from aegis._format import icon_mime, iter_raw_entries
+from aegis.workers import iter_batches, ordered_map
+
+EXTENSIONS = {
+    "image/png": "png",
+    "image/jpeg": "jpg",
+    "image/webp": "webp",
+    "image/svg+xml": "svg"
+}
+
+def icon_extension(mime, data):
+    """Returns the file extension for an icon with the given MIME type. The
+    data is sniffed if the MIME type is missing or unknown."""
+    if mime not in EXTENSIONS:
+        mime = icon_mime(data)
+    return EXTENSIONS.get(mime, "bin")
+
+def _write_icon(output, filename, data):
+    path = os.path.join(output, filename)
+    if os.path.exists(path):
+        return False
+
+    # other workers may write the same icon at the same time, so write it atomically
+    fd, tmp_path = tempfile.mkstemp(dir=output, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return True
+
+def _extract_batch(output, first_index, raw_entries):
+    problems = []
+    mapping = []
+    for i, raw in enumerate(raw_entries):
+        index = first_index + i
+        try:
+            entry = json.loads(raw)
+        except ValueError as e:
+            problems.append((index, "invalid JSON: {}".format(e)))
+            continue
+
+        filename = None
+        if entry.get("icon") is not None:
+            try:
+                data = b64decode(entry["icon"], validate=True)
+            except (binascii.Error, TypeError, ValueError):
+                problems.append((index, "icon is not valid base64"))
+            else:
+                digest = hashlib.sha256(data).hexdigest()
+                filename = "{}.{}".format(digest, icon_extension(entry.get("icon_mime"), data))
+                _write_icon(output, filename, data)
+
+        mapping.append({
+            "index": index,
+            "uuid": entry.get("uuid"),
+            "issuer": entry.get("issuer"),
+            "name": entry.get("name"),
+            "icon": filename
+        })
+    return len(raw_entries), problems, mapping
+
+class ExtractSummary:
+    def __init__(self):
+        self.entries = 0
+        self.icons = 0
+        self.unique = set()
+        self.problems = 0
+
+    def __str__(self):
+        return "{} entries, {} icons, {} unique icons, {} problems".format(
+            self.entries, self.icons, len(self.unique), self.problems
+        )
+
+def extract_icons(f, output, workers=None, batch_size=1000, report=None):
+    """Streams the entries of the given binary file, which contains a plain
+    vault or a decrypted vault database, and writes every embedded icon to the
+    output directory, spread over a pool of worker processes. Icons are named
+    after the SHA-256 hash of their contents, so identical icons are only
+    written once. The given report function is called with the index of the
+    entry and a description of every problem that is found. Returns an
+    ExtractSummary and a list with the icon filename of every entry."""
+    summary = ExtractSummary()
+    mapping = []
+
+    def handle(res):
+        count, problems, batch_mapping = res
+        summary.entries += count
+        for index, problem in problems:
+            summary.problems += 1
+            if report is not None:
+                report(index, problem)
+        for item in batch_mapping:
+            if item["icon"] is not None:
+                summary.icons += 1
+                summary.unique.add(item["icon"])
+        mapping.extend(batch_mapping)
+
+    tasks = ((output, first, batch) for first, batch in iter_batches(iter_raw_entries(f), batch_size))
+    for res in ordered_map(_extract_batch, tasks, workers=workers):
+        handle(res)
+    return summary, mapping
@@ -0,0 +1,89 @@
+import io
+import json
+import os
+import random
+
+from aegis.icons import icon_slug
+from aegis.minify import format_path
+
+_SYLLABLES = (
+    "ba", "co", "da", "fi", "go", "hu", "ka", "lo", "me", "ni", "po", "qu", "ra",
+    "si", "tu", "vo", "wa", "xe", "yo", "ze", "an", "el", "in", "or", "us"
+)
+_SUFFIXES = ("", "", "", ".io", ".com", "+", " & Co", " Cloud", " Pay")
+
+def _title(rng, index):
+    # the words only have letters, so the index makes every slug unique
+    word = "".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+    return "{} {}{}".format(word, index, rng.choice(_SUFFIXES))
+
+def _delta(rng, pos):
+    # random steps that are pulled back to the center to stay inside the view box
+    return rng.uniform(-2.5, 2.5) + (12 - pos) * 0.15
+
+def fake_icon_path(rng, segments=40):
+    """Returns random path data in a 24x24 view box with the given amount of
+    segments, mixing the commands that occur in simple-icons."""
+    x, y = rng.uniform(4, 20), rng.uniform(4, 20)
+    res = [("M", [x, y])]
+    for i in range(segments):
+        cmd = rng.choice("cccllhvsqaz")
+        if cmd == "z" and 0 < i < segments - 1:
+            # start a new subpath
+            x, y = rng.uniform(4, 20), rng.uniform(4, 20)
+            res.append(("z", []))
+            res.append(("M", [x, y]))
+            continue
+        if cmd == "z":
+            cmd = "l"
+
+        dx, dy = _delta(rng, x), _delta(rng, y)
+        if cmd == "h":
+            args = [dx]
+            dy = 0
+        elif cmd == "v":
+            args = [dy]
+            dx = 0
+        elif cmd == "l":
+            args = [dx, dy]
+        elif cmd in ("s", "q"):
+            args = [_delta(rng, x), _delta(rng, y), dx, dy]
+        elif cmd == "a":
+            r = rng.uniform(0.5, 4)
+            args = [r, r, 0, rng.randint(0, 1), rng.randint(0, 1), dx, dy]
+        else:
+            args = [_delta(rng, x), _delta(rng, y), _delta(rng, x), _delta(rng, y), dx, dy]
+        res.append((cmd, args))
+        x += dx
+        y += dy
+    res.append(("z", []))
+    return format_path(res, precision=3)
+
+def write_fake_checkout(path, count=3000, segments=40, seed=None):
+    """Writes a fake simple-icons checkout with the given amount of random icons
+    to the given path, with data/simple-icons.json and an icons directory, for
+    benchmarking without the real thing. The amount of path segments of every
+    icon varies between half and one and a half times the given amount. Using
+    the same seed gives the same checkout. Returns the metadata."""
+    rng = random.Random(seed)
+    os.makedirs(os.path.join(path, "data"), exist_ok=True)
+    os.makedirs(os.path.join(path, "icons"), exist_ok=True)
+
+    icons = []
+    for i in range(count):
+        title = _title(rng, i)
+        icon = {
+            "title": title,
+            "hex": "{:06X}".format(rng.randrange(1 << 24)),
+            "source": "https://example.com/{}".format(i)
+        }
+        icons.append(icon)
+
+        slug = icon_slug(icon)
+        d = fake_icon_path(rng, segments=rng.randint(max(1, segments // 2), max(1, segments * 3 // 2)))
+        with io.open(os.path.join(path, "icons", slug + ".svg"), "w") as f:
+            f.write('<svg role="img" viewBox="0 0 24 24" xmlns="http://www.w3.org/2000/svg"><title>{}</title><path d="{}"/></svg>'.format(title.replace("&", "&amp;"), d))
+
+    with io.open(os.path.join(path, "data", "simple-icons.json"), "w") as f:
+        json.dump(icons, f, indent=4)
+    return icons
@@ -1,15 +1,21 @@
+import fnmatch
 import io
 import json
 import os
 import re
+import secrets
+import time
 import unicodedata
 from collections import OrderedDict
+from xml.parsers import expat
+from xml.sax.saxutils import escape, quoteattr
 
 import xmltodict
-from lxml import etree
-from reportlab.graphics import renderPM
-from reportlab.graphics.shapes import Drawing
-from svglib.svglib import svg2rlg, SvgRenderer
+
+from aegis.metrics import emit
+from aegis.render import get_backend
+
+SHAPES = ("circle", "square")
 
 # source: https://github.com/simple-icons/simple-icons/blob/e5b3b29f1b12974c59db524a272f6cd929545991/scripts/utils.js
 def icon_title_to_name(title):
@@ -34,49 +40,249 @@ def icon_title_to_name(title):
 
     return title.replace(" ", "")
 
+def icon_slug(icon):
+    """Returns the slug, and thus the filename, of the icon with the given
+    simple-icons metadata."""
+    if "slug" in icon:
+        return icon["slug"]
+    name = icon_title_to_name(icon["title"])
+    return re.sub(r"[^a-zA-Z0-9  ]", "", _remove_accents(name))
+
+class _UnusualSVG(Exception):
+    pass
+
+def _parse_simple_svg(data):
+    """Parses an SVG that consists of nothing but an optional title and a single
+    path, like nearly all of simple-icons, with expat instead of building an
+    xmltodict tree. Returns the attributes of the root and a list of the
+    (name, attributes, text) of its children in order, or None if the SVG is
+    any more complicated than that."""
+    root = None
+    children = []
+    stack = []
+    text = []
+
+    def start(name, attrs):
+        nonlocal root
+        if len(stack) == 0:
+            if name != "svg":
+                raise _UnusualSVG()
+            root = attrs
+        elif len(stack) > 1 or name not in ("title", "path") or any(child[0] == name for child in children) \
+                or (name == "title" and len(attrs) > 0):
+            raise _UnusualSVG()
+        else:
+            children.append((name, attrs, None))
+        stack.append(name)
+        text.clear()
+
+    def end(name):
+        stack.pop()
+        content = "".join(text).strip()
+        text.clear()
+        if len(stack) == 1 and name == "title":
+            children[-1] = (name, {}, content)
+        elif content:
+            raise _UnusualSVG()
+
+    parser = expat.ParserCreate()
+    parser.ordered_attributes = False
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.CharacterDataHandler = text.append
+    try:
+        parser.Parse(data, True)
+    except (_UnusualSVG, expat.ExpatError):
+        return None
+    if not any(child[0] == "path" for child in children):
+        return None
+    return root, children
+
+_SHAPE_TEMPLATES = {
+    "circle": '\t<circle cx="12" cy="12" r="12" fill={}></circle>',
+    "square": '\t<rect width="24" height="24" rx="2" fill={}></rect>'
+}
+
+def _attrs_xml(attrs):
+    return "".join(" {}={}".format(key, quoteattr(val)) for key, val in attrs.items())
+
+def _emit_simple_svg(root, children, shape, color):
+    # this gives the exact same output as xmltodict.unparse(pretty=True) of the transformed tree
+    lines = ['<?xml version="1.0" encoding="utf-8"?>', "<svg{}>".format(_attrs_xml(root))]
+    for name, attrs, text in children:
+        if name == "title":
+            lines.append("\t<title>{}</title>".format(escape(text)))
+        else:
+            lines.append(_SHAPE_TEMPLATES[shape].format(quoteattr("#" + color)))
+            attrs = dict(attrs)
+            attrs["transform"] = "translate(4.8, 4.8) scale(0.6)"
+            attrs["fill"] = "white"
+            lines.append("\t<path{}></path>".format(_attrs_xml(attrs)))
+    lines.append("</svg>")
+    return "\n".join(lines)
+
+def _remove_accents(s):
+    norm = unicodedata.normalize("NFKD", s)
+    return u"".join([c for c in norm if not unicodedata.combining(c)])
+
 class Icon:
-    def __init__(self, title, filename, svg):
+    def __init__(self, title, filename, svg, pretty=True, on_event=None, xml=None):
+        """Either the xmltodict tree of the SVG or its pretty-printed XML must be
+        given. The tree is parsed from the XML when it's first needed."""
         self.title = title
         self.filename = filename
-        self.svg = svg
-
-    def get_xml(self):
-        return xmltodict.unparse(self.svg, pretty=True)
-
-    def render_png(self, width=800, height=800):
-        # svglib expects an lxml structure internally
-        parser = etree.XMLParser(remove_comments=True, recover=True)
-        svg = etree.fromstring(self.get_xml().encode("utf-8"), parser=parser)
-
-        # render the SVG to a PNG
-        renderer = SvgRenderer(None)
-        drawing = renderer.render(svg)
-        scale_x = width / drawing.width
-        scale_y = height / drawing.height
-        drawing.width = width
-        drawing.height = height
-        drawing.scale(scale_x, scale_y)
-        return renderPM.drawToString(drawing, fmt="PNG")
+        self._svg = svg
+        self._xml = xml
+        self.pretty = pretty
+        self.on_event = on_event
+
+    @property
+    def svg(self):
+        if self._svg is None:
+            self._svg = xmltodict.parse(self._xml)
+        return self._svg
+
+    def get_xml(self, record=True):
+        """Returns the XML of the icon. Without record, no serialize event is
+        emitted, for callers that only need the size of the original XML."""
+        start = time.perf_counter()
+        if self._xml is not None and self.pretty:
+            xml = self._xml
+        elif not self.pretty:
+            xml = xmltodict.unparse(self.svg, full_document=False, short_empty_elements=True)
+        else:
+            xml = xmltodict.unparse(self.svg, pretty=True)
+        if record:
+            emit(self.on_event, "serialize", self.filename, start, len(xml))
+        return xml
+
+    def render_png(self, width=800, height=800, backend=None):
+        """Renders the icon to a PNG with the given render backend, which is
+        either a name or an instance from aegis.render. The default is
+        reportlab, which is always available."""
+        if backend is None or isinstance(backend, str):
+            backend = get_backend(backend)
+        # the serialize stage is timed separately
+        svg = self.get_xml().encode("utf-8")
+        start = time.perf_counter()
+        png = backend.render(svg, width, height)
+        emit(self.on_event, "render", self.filename, start, len(png))
+        return png
+
+class IconFilter:
+    """Matches icons by slug, title glob or hex color glob, based on their
+    simple-icons metadata alone. An icon matches if any of the rules match.
+    Titles and colors are matched case-insensitively."""
+
+    def __init__(self, slugs=(), titles=(), hexes=()):
+        self.slugs = set(slugs)
+        self.titles = [t.lower() for t in titles]
+        self.hexes = [h.lower().lstrip("#") for h in hexes]
+
+    @classmethod
+    def parse(cls, specs):
+        """Creates a filter from a list of 'slug:<slug>', 'title:<glob>',
+        'hex:<glob>' and 'file:<path>' specs. A spec without a prefix is a slug.
+        Files list one slug per line, lines starting with # are ignored."""
+        slugs, titles, hexes = [], [], []
+        for spec in specs:
+            kind, sep, value = spec.partition(":")
+            if not sep:
+                kind, value = "slug", spec
+
+            if kind == "slug":
+                slugs.append(value)
+            elif kind == "title":
+                titles.append(value)
+            elif kind == "hex":
+                hexes.append(value)
+            elif kind == "file":
+                with io.open(value, "r") as f:
+                    for line in f:
+                        line = line.strip()
+                        if line and not line.startswith("#"):
+                            slugs.append(line)
+            else:
+                raise ValueError("unknown icon filter: {}".format(spec))
+        return cls(slugs=slugs, titles=titles, hexes=hexes)
+
+    def matches(self, slug, icon):
+        if slug in self.slugs:
+            return True
+        title = icon["title"].lower()
+        if any(fnmatch.fnmatchcase(title, t) for t in self.titles):
+            return True
+        color = icon.get("hex", "").lower()
+        return any(fnmatch.fnmatchcase(color, h) for h in self.hexes)
 
 class IconGenerator:
-    def __init__(self, path):
+    def __init__(self, path, metadata=None, on_event=None, fast=True):
+        """Loads the simple-icons index from the checkout at the given path, or
+        from the given metadata file. The optional on_event callback receives an
+        aegis.metrics.Event for every stage of every icon that is generated.
+
+        If fast is set, icons that only have a title and a single path are
+        generated from a template instead of an xmltodict tree, which gives the
+        same XML. Other icons always take the tree path."""
+        self._on_event = on_event
+        self._fast = fast
         self._icon_dir = os.path.join(path)
-        with io.open(os.path.join(self._icon_dir, "data", "simple-icons.json"), "r") as f:
+        if metadata is None:
+            metadata = os.path.join(self._icon_dir, "data", "simple-icons.json")
+        with io.open(metadata, "r") as f:
             self._icons = json.load(f)
+        self._slugs = None
+
+    def get_slug(self, icon):
+        return icon_slug(icon)
+
+    def find(self, slug):
+        if self._slugs is None:
+            self._slugs = {self.get_slug(icon): icon for icon in self._icons}
+        return self._slugs.get(slug)
 
     def generate(self, icon, square=False):
+        shape = "square" if square else "circle"
+        return self.generate_variants(icon, shapes=(shape,))[shape]
+
+    def generate_variants(self, icon, shapes=SHAPES):
+        """Generates the given shape variants of the given icon. The SVG file is
+        only read and parsed once, all variants are derived from the same tree.
+        Returns a dict with an Icon for every shape."""
+        for shape in shapes:
+            if shape not in SHAPES:
+                raise ValueError("unsupported shape: {}".format(shape))
+
         title = icon["title"]
-        name = icon_title_to_name(title)
-        name = re.sub(r"[^a-zA-Z0-9  ]", "", self._remove_accents(name))
-        filename = (icon["slug"] if "slug" in icon else name) + ".svg"
+        filename = self.get_slug(icon) + ".svg"
         full_filename = os.path.join(self._icon_dir, "icons", filename)
+        start = time.perf_counter()
         with io.open(full_filename, "r") as f:
-            xml = xmltodict.parse(f.read())
+            data = f.read()
+
+        simple = _parse_simple_svg(data) if self._fast else None
+        if simple is not None:
+            emit(self._on_event, "parse", filename, start, len(data))
+            variants = {}
+            for shape in shapes:
+                start = time.perf_counter()
+                xml = _emit_simple_svg(*simple, shape, icon["hex"])
+                emit(self._on_event, "transform", filename, start)
+                variants[shape] = Icon(title, filename, None, on_event=self._on_event, xml=xml)
+            return variants
+
+        xml = xmltodict.parse(data)
+        emit(self._on_event, "parse", filename, start, len(data))
+
+        return {shape: Icon(title, filename, self._transform(icon, filename, xml, shape), on_event=self._on_event) for shape in shapes}
 
+    def _transform(self, icon, filename, xml, shape):
+        # only copy the parts of the tree that change, so that the variants can share the rest
+        start = time.perf_counter()
         svg = OrderedDict()
         for key, val in xml["svg"].items():
             if key == "path":
-                if not square:
+                if shape == "circle":
                     svg["circle"] = {
                         "@cx": 12,
                         "@cy": 12,
@@ -90,21 +296,43 @@ class IconGenerator:
                         "@rx": 2,
                         "@fill": "#" + icon["hex"]
                     }
+                val = type(val)(val)
                 val["@transform"] = "translate(4.8, 4.8) scale(0.6)"
                 val["@fill"] = "white"
             svg[key] = val
 
-        xml["svg"] = svg
-        return Icon(title, filename, xml)
+        res = type(xml)(xml)
+        res["svg"] = svg
+        emit(self._on_event, "transform", filename, start)
+        return res
+
+    def choose_random(self):
+        return secrets.choice(self._icons)
 
     def generate_random(self):
-        return self.generate(secrets.choice(self._icons))
+        return self.generate(self.choose_random())
 
-    def generate_all(self, square=False):
+    def select(self, only: IconFilter=None, exclude: IconFilter=None):
+        """Yields the metadata of the icons that match the given filters. No SVG
+        files are opened to do so."""
         for icon in self._icons:
+            if only is None and exclude is None:
+                yield icon
+                continue
+
+            slug = self.get_slug(icon)
+            if only is not None and not only.matches(slug, icon):
+                continue
+            if exclude is not None and exclude.matches(slug, icon):
+                continue
+            yield icon
+
+    def generate_all(self, square=False, only: IconFilter=None, exclude: IconFilter=None):
+        for icon in self.select(only=only, exclude=exclude):
             yield self.generate(icon, square)
 
-    @staticmethod
-    def _remove_accents(s):
-        norm = unicodedata.normalize("NFKD", s)
-        return u"".join([c for c in norm if not unicodedata.combining(c)])
+    def generate_all_variants(self, shapes=SHAPES, only: IconFilter=None, exclude: IconFilter=None):
+        """Like generate_all, but yields a dict with every shape variant of
+        every icon, see generate_variants."""
+        for icon in self.select(only=only, exclude=exclude):
+            yield self.generate_variants(icon, shapes=shapes)
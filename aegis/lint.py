@@ -0,0 +1,192 @@
+import binascii
+import json
+import re
+import uuid
+from array import array
+from base64 import b32decode, b64decode
+from collections import Counter
+
+from aegis._format import ALGORITHMS, ENTRY_TYPES, icon_mime, iter_raw_entries
+from aegis.workers import iter_batches, ordered_map
+
+_BASE32_RE = re.compile(r"^[A-Z2-7]+=*$")
+
+def lint_entry(entry):
+    """Checks the given entry against the schema produced by
+    VaultGenerator.generate_entry. Returns a tuple of a list of problems, the
+    UUID of the entry (or None if it's invalid) and the decoded icon data."""
+    if not isinstance(entry, dict):
+        return ["entry is not an object"], None, None
+
+    problems = []
+    if entry.get("type") not in ENTRY_TYPES:
+        problems.append("unknown type: {!r}".format(entry.get("type")))
+    for key in ("name", "issuer"):
+        if not isinstance(entry.get(key), str):
+            problems.append("{} is not a string".format(key))
+
+    entry_uuid = None
+    try:
+        entry_uuid = uuid.UUID(entry["uuid"])
+    except (KeyError, TypeError, ValueError, AttributeError):
+        problems.append("invalid uuid: {!r}".format(entry.get("uuid")))
+
+    info = entry.get("info")
+    if not isinstance(info, dict):
+        problems.append("info is not an object")
+    else:
+        secret = info.get("secret")
+        if not isinstance(secret, str) or not _BASE32_RE.match(secret):
+            problems.append("secret is not valid base32")
+        else:
+            try:
+                b32decode(secret.rstrip("=") + "=" * (-len(secret.rstrip("=")) % 8))
+            except binascii.Error:
+                problems.append("secret is not valid base32")
+        if info.get("algo") not in ALGORITHMS:
+            problems.append("unknown algorithm: {!r}".format(info.get("algo")))
+        if not isinstance(info.get("digits"), int) or not 1 <= info["digits"] <= 10:
+            problems.append("invalid digits: {!r}".format(info.get("digits")))
+        if entry.get("type") == "hotp":
+            if not isinstance(info.get("counter"), int):
+                problems.append("invalid counter: {!r}".format(info.get("counter")))
+        elif not isinstance(info.get("period"), int) or info["period"] <= 0:
+            problems.append("invalid period: {!r}".format(info.get("period")))
+
+    icon = None
+    if entry.get("icon") is not None:
+        try:
+            icon = b64decode(entry["icon"], validate=True)
+        except (binascii.Error, TypeError, ValueError):
+            problems.append("icon is not valid base64")
+        else:
+            mime = icon_mime(icon)
+            if "icon_mime" not in entry:
+                problems.append("icon_mime is missing")
+            elif mime is None:
+                problems.append("icon is not a recognized image format")
+            elif entry["icon_mime"] != mime:
+                problems.append("icon_mime is {!r}, but the icon is {!r}".format(entry["icon_mime"], mime))
+
+    return problems, entry_uuid, icon
+
+def _lint_batch(first_index, raw_entries):
+    problems = []
+    uuids = bytearray()
+    uuid_indices = array("Q")
+    mimes = Counter()
+    icon_bytes = 0
+    for i, raw in enumerate(raw_entries):
+        index = first_index + i
+        try:
+            entry = json.loads(raw)
+        except ValueError as e:
+            problems.append((index, "invalid JSON: {}".format(e)))
+            continue
+
+        entry_problems, entry_uuid, icon = lint_entry(entry)
+        problems.extend((index, p) for p in entry_problems)
+        if entry_uuid is not None:
+            uuids += entry_uuid.bytes
+            uuid_indices.append(index)
+        if icon is not None:
+            icon_bytes += len(icon)
+            mimes[entry.get("icon_mime")] += 1
+
+    return len(raw_entries), problems, bytes(uuids), uuid_indices, icon_bytes, mimes
+
+class _HashSet:
+    """An open addressing hash set of 128-bit keys given as 16 bytes, like
+    UUIDs, which takes 32 bytes per item instead of the ~100 bytes of a set of
+    bytes. Every key is stored as two 64-bit halves, so keys are compared in
+    full. A slot with two zero halves is empty, so the zero key is tracked
+    separately."""
+
+    def __init__(self, capacity=1024):
+        self._slots = array("Q", bytes(16 * capacity))
+        self._len = 0
+        self._zero = False
+
+    def add(self, key):
+        """Adds the key to the set. Returns False if it was already in it."""
+        return self._add(int.from_bytes(key[:8], "little"), int.from_bytes(key[8:], "little"))
+
+    def _add(self, hi, lo):
+        if hi == 0 and lo == 0:
+            if self._zero:
+                return False
+            self._zero = True
+            self._len += 1
+            return True
+
+        if (self._len + 1) * 4 > len(self._slots):
+            self._grow()
+
+        slots = self._slots
+        mask = len(slots) // 2 - 1
+        i = ((hi ^ lo) * 0x9E3779B97F4A7C15 >> 32) & mask
+        while slots[2 * i] != 0 or slots[2 * i + 1] != 0:
+            if slots[2 * i] == hi and slots[2 * i + 1] == lo:
+                return False
+            i = (i + 1) & mask
+        slots[2 * i] = hi
+        slots[2 * i + 1] = lo
+        self._len += 1
+        return True
+
+    def _grow(self):
+        old = self._slots
+        self._slots = array("Q", bytes(16 * len(old)))
+        self._len = 1 if self._zero else 0
+        for i in range(0, len(old), 2):
+            if old[i] != 0 or old[i + 1] != 0:
+                self._add(old[i], old[i + 1])
+
+    def __len__(self):
+        return self._len
+
+class LintSummary:
+    def __init__(self):
+        self.entries = 0
+        self.problems = 0
+        self.duplicates = 0
+        self.icons = 0
+        self.icon_bytes = 0
+        self.icon_mimes = Counter()
+
+    def __str__(self):
+        mimes = ", ".join("{}: {}".format(mime, count) for mime, count in sorted(self.icon_mimes.items(), key=str))
+        return "{} entries, {} problems, {} duplicate UUIDs, {} icons totaling {:.1f} MiB{}".format(
+            self.entries, self.problems, self.duplicates, self.icons,
+            self.icon_bytes / 1024 / 1024, " ({})".format(mimes) if mimes else ""
+        )
+
+def lint_vault(f, workers=None, batch_size=1000, report=None):
+    """Streams the entries of the given binary file and checks every one of
+    them, spread over a pool of worker processes. The given report function is
+    called with the index of the entry and a description of every problem that
+    is found. Returns a LintSummary."""
+    summary = LintSummary()
+    seen = _HashSet()
+
+    def handle(res):
+        count, problems, uuids, uuid_indices, icon_bytes, mimes = res
+        summary.entries += count
+        summary.icons += sum(mimes.values())
+        summary.icon_bytes += icon_bytes
+        summary.icon_mimes.update(mimes)
+        for index, problem in problems:
+            summary.problems += 1
+            if report is not None:
+                report(index, problem)
+        for i, index in enumerate(uuid_indices):
+            b = uuids[16 * i:16 * (i + 1)]
+            if not seen.add(b):
+                summary.duplicates += 1
+                summary.problems += 1
+                if report is not None:
+                    report(index, "duplicate uuid: {}".format(uuid.UUID(bytes=b)))
+
+    for res in ordered_map(_lint_batch, iter_batches(iter_raw_entries(f), batch_size), workers=workers):
+        handle(res)
+    return summary
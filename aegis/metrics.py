@@ -0,0 +1,67 @@
+import time
+from array import array
+from collections import namedtuple
+
+# serialize is the SVG of an icon, encode the JSON of a vault entry
+STAGES = ("parse", "transform", "serialize", "render", "encode", "encrypt", "write")
+
+# A timing event emitted by the generators. The name identifies the icon the
+# event is about, if any, and size is the amount of bytes produced, if known.
+Event = namedtuple("Event", ["stage", "name", "duration", "size"])
+
+def emit(on_event, stage, name, start, size=None):
+    """Calls the given event callback, if any, with an event for a stage that
+    started at the given time.perf_counter() timestamp."""
+    if on_event is not None:
+        on_event(Event(stage, name, time.perf_counter() - start, size))
+
+def _percentile(values, p):
+    if len(values) == 0:
+        return 0
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+class Metrics:
+    """Collects the events of the generators. An instance can be passed as the
+    on_event callback directly."""
+
+    def __init__(self):
+        self._durations = {}
+        self._sizes = {}
+        self._names = {}
+        self._start = time.perf_counter()
+
+    def __call__(self, event):
+        self._durations.setdefault(event.stage, array("d")).append(event.duration)
+        if event.size is not None:
+            self._sizes[event.stage] = self._sizes.get(event.stage, 0) + event.size
+        if event.name is not None:
+            stages = self._names.setdefault(event.name, {})
+            stages[event.stage] = stages.get(event.stage, 0) + event.duration
+
+    def summary(self, slowest=20):
+        """Returns a JSON serializable summary with percentiles per stage and the
+        given amount of slowest icons."""
+        stages = {}
+        for stage, durations in self._durations.items():
+            durations = sorted(durations)
+            total = sum(durations)
+            stages[stage] = {
+                "count": len(durations),
+                "total": total,
+                "mean": total / len(durations),
+                "p50": _percentile(durations, 50),
+                "p90": _percentile(durations, 90),
+                "p99": _percentile(durations, 99),
+                "max": durations[-1],
+                "bytes": self._sizes.get(stage)
+            }
+
+        names = sorted(self._names.items(), key=lambda item: sum(item[1].values()), reverse=True)
+        return {
+            "elapsed": time.perf_counter() - self._start,
+            "stages": stages,
+            "slowest": [
+                {"name": name, "duration": sum(durations.values()), "stages": durations}
+                for name, durations in names[:slowest]
+            ]
+        }
@@ -0,0 +1,161 @@
+import secrets
+from base64 import b32decode, b64decode, b64encode
+from urllib.parse import parse_qs, quote, urlsplit
+
+# the enum values of the Google Authenticator migration protobuf
+_ALGORITHMS = {"SHA1": 1, "SHA256": 2, "SHA512": 3, "MD5": 4}
+_DIGITS = {6: 1, 8: 2}
+_TYPES = {"hotp": 1, "totp": 2}
+
+_URI_PREFIX = "otpauth-migration://offline?data="
+
+# the largest trailer a payload can have: version, batch_size, batch_index and batch_id
+_MAX_TRAILER_SIZE = 3 * (1 + 5) + (1 + 10)
+
+class MigrationError(Exception):
+    pass
+
+def _varint(n):
+    if n < 0:
+        n += 1 << 64
+    res = bytearray()
+    while True:
+        b = n & 0x7f
+        n >>= 7
+        if n:
+            res.append(b | 0x80)
+        else:
+            res.append(b)
+            return bytes(res)
+
+def _field_varint(num, value):
+    return _varint(num << 3) + _varint(value)
+
+def _field_bytes(num, value):
+    return _varint(num << 3 | 2) + _varint(len(value)) + value
+
+def encode_otp_parameters(entry):
+    """Encodes the given vault entry as an OtpParameters message. Raises a
+    MigrationError if the entry can't be represented in the migration format."""
+    info = entry["info"]
+    if entry["type"] not in _TYPES:
+        raise MigrationError("unsupported type: {}".format(entry["type"]))
+    if info["algo"] not in _ALGORITHMS:
+        raise MigrationError("unsupported algorithm: {}".format(info["algo"]))
+    if info["digits"] not in _DIGITS:
+        raise MigrationError("unsupported amount of digits: {}".format(info["digits"]))
+
+    secret = info["secret"].rstrip("=")
+    secret = b32decode(secret + "=" * (-len(secret) % 8), casefold=True)
+    msg = _field_bytes(1, secret)
+    msg += _field_bytes(2, entry["name"].encode("utf-8"))
+    msg += _field_bytes(3, entry["issuer"].encode("utf-8"))
+    msg += _field_varint(4, _ALGORITHMS[info["algo"]])
+    msg += _field_varint(5, _DIGITS[info["digits"]])
+    msg += _field_varint(6, _TYPES[entry["type"]])
+    if entry["type"] == "hotp":
+        msg += _field_varint(7, info["counter"])
+    return _field_bytes(1, msg)
+
+def _payload_uri(params, batch_size, batch_index, batch_id):
+    payload = b"".join(params)
+    payload += _field_varint(2, 1)
+    payload += _field_varint(3, batch_size)
+    payload += _field_varint(4, batch_index)
+    payload += _field_varint(5, batch_id)
+    return _URI_PREFIX + quote(b64encode(payload).decode("utf-8"), safe="")
+
+def _uri_length(payload_size):
+    # every base64 character may need to be percent-encoded in the worst case
+    return len(_URI_PREFIX) + (payload_size + 2) // 3 * 4 * 3
+
+def _fits(group, max_uri_length):
+    # only build the URI if the worst case estimate of its length is too long
+    size = _MAX_TRAILER_SIZE + sum(len(params) for params in group)
+    if _uri_length(size) <= max_uri_length:
+        return True
+    max_field = (1 << 31) - 1
+    return len(_payload_uri(group, max_field, max_field, max_field)) <= max_uri_length
+
+def split_entries(entries, max_uri_length=1024, errors=None):
+    """Encodes the given vault entries and splits them into groups, so that
+    the migration URI of every group is at most max_uri_length characters
+    long. Returns a list of lists of encoded OtpParameters. Entries that can't
+    be encoded are reported to the errors callback with the entry and the
+    error."""
+    groups = []
+    group = []
+    for entry in entries:
+        try:
+            params = encode_otp_parameters(entry)
+        except (MigrationError, KeyError, ValueError) as e:
+            if errors is not None:
+                errors(entry, e)
+            continue
+
+        if not _fits(group + [params], max_uri_length):
+            if len(group) == 0 or not _fits([params], max_uri_length):
+                if errors is not None:
+                    errors(entry, MigrationError("entry doesn't fit in a single payload"))
+                continue
+            groups.append(group)
+            group = []
+        group.append(params)
+
+    if len(group) > 0:
+        groups.append(group)
+    return groups
+
+def generate_migration_uris(entries, max_uri_length=1024, batch_id=None, errors=None):
+    """Yields the otpauth-migration URIs of one batch that holds all of the
+    given entries, without any URI exceeding max_uri_length characters."""
+    if batch_id is None:
+        batch_id = secrets.randbits(31)
+
+    groups = split_entries(entries, max_uri_length=max_uri_length, errors=errors)
+    for i, group in enumerate(groups):
+        yield _payload_uri(group, len(groups), i, batch_id)
+
+def _read_varint(data, pos):
+    res = shift = 0
+    while True:
+        if pos >= len(data):
+            raise MigrationError("truncated varint")
+        b = data[pos]
+        pos += 1
+        res |= (b & 0x7f) << shift
+        shift += 7
+        if not b & 0x80:
+            return res, pos
+
+def _read_fields(data):
+    pos = 0
+    while pos < len(data):
+        key, pos = _read_varint(data, pos)
+        num, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, pos = _read_varint(data, pos)
+        elif wire_type == 2:
+            length, pos = _read_varint(data, pos)
+            value = data[pos:pos + length]
+            pos += length
+        else:
+            raise MigrationError("unsupported wire type: {}".format(wire_type))
+        yield num, value
+
+def decode_migration_uri(uri):
+    """Decodes the given otpauth-migration URI into a dict with the batch
+    fields and a list of the OtpParameters fields of every entry."""
+    url = urlsplit(uri)
+    if url.scheme != "otpauth-migration":
+        raise MigrationError("not an otpauth-migration URI")
+    data = b64decode(parse_qs(url.query)["data"][0])
+
+    res = {"otp_parameters": []}
+    names = {2: "version", 3: "batch_size", 4: "batch_index", 5: "batch_id"}
+    for num, value in _read_fields(data):
+        if num == 1:
+            res["otp_parameters"].append(dict(_read_fields(value)))
+        elif num in names:
+            res[names[num]] = value
+    return res
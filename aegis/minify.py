@@ -0,0 +1,180 @@
+import copy
+import re
+
+from aegis.icons import Icon
+
+_STRIP_KEYS = {"title", "desc", "metadata", "@role"}
+
+_PATH_ARGS = {
+    "M": 2, "L": 2, "T": 2, "H": 1, "V": 1, "C": 6, "S": 4, "Q": 4, "A": 7, "Z": 0
+}
+
+_NUM_RE = re.compile(r"[-+]?(?:\d*\.\d+|\d+\.?)(?:[eE][-+]?\d+)?")
+_FLAG_RE = re.compile(r"[01]")
+_SEP_RE = re.compile(r"[\s,]*")
+_TRANSFORM_RE = re.compile(
+    r"^\s*translate\(\s*({0})[\s,]+({0})\s*\)\s*scale\(\s*({0})\s*\)\s*$".format(_NUM_RE.pattern)
+)
+
+def parse_path(d):
+    """Parses SVG path data into a list of (command, [args]) tuples, one tuple
+    per segment. Implicitly repeated commands are expanded."""
+    segments = []
+    pos = 0
+    cmd = None
+    while True:
+        pos = _SEP_RE.match(d, pos).end()
+        if pos >= len(d):
+            break
+
+        if d[pos].isalpha():
+            cmd = d[pos]
+            pos += 1
+            if cmd.upper() not in _PATH_ARGS:
+                raise ValueError("unknown path command: {}".format(cmd))
+            if cmd.upper() == "Z":
+                segments.append((cmd, []))
+                continue
+        elif cmd is None or cmd.upper() == "Z":
+            raise ValueError("path data has arguments without a command")
+
+        args = []
+        for i in range(_PATH_ARGS[cmd.upper()]):
+            pos = _SEP_RE.match(d, pos).end()
+            # the large-arc and sweep flags of arcs may be written without separators
+            regex = _FLAG_RE if cmd.upper() == "A" and i in (3, 4) else _NUM_RE
+            m = regex.match(d, pos)
+            if m is None:
+                raise ValueError("malformed path data at offset {}".format(pos))
+            args.append(float(m.group(0)))
+            pos = m.end()
+        segments.append((cmd, args))
+
+        # a moveto followed by more coordinates is an implicit lineto
+        if cmd == "M":
+            cmd = "L"
+        elif cmd == "m":
+            cmd = "l"
+
+    return segments
+
+def transform_path(segments, tx, ty, scale):
+    """Applies 'translate(tx, ty) scale(scale)' to the given path segments."""
+    res = []
+    for i, (cmd, args) in enumerate(segments):
+        args = list(args)
+        upper = cmd.upper()
+        absolute = cmd == upper
+        if upper == "A":
+            args[0] *= scale
+            args[1] *= scale
+            args[5:7] = _transform_point(args[5], args[6], tx, ty, scale, absolute)
+        elif upper == "H":
+            args[0] = tx + args[0] * scale if absolute else args[0] * scale
+        elif upper == "V":
+            args[0] = ty + args[0] * scale if absolute else args[0] * scale
+        else:
+            for j in range(0, len(args), 2):
+                # the first moveto is always absolute
+                abs_point = absolute or (i == 0 and upper == "M" and j == 0)
+                args[j:j+2] = _transform_point(args[j], args[j+1], tx, ty, scale, abs_point)
+        res.append((cmd, args))
+    return res
+
+def _transform_point(x, y, tx, ty, scale, absolute):
+    if absolute:
+        return [tx + x * scale, ty + y * scale]
+    return [x * scale, y * scale]
+
+def format_number(n, precision=3):
+    s = "{:.{}f}".format(round(n, precision), precision)
+    if "." in s:
+        s = s.rstrip("0").rstrip(".")
+    if s in ("-0", ""):
+        s = "0"
+    if s.startswith("0."):
+        s = s[1:]
+    elif s.startswith("-0."):
+        s = "-" + s[2:]
+    return s
+
+def format_path(segments, precision=3):
+    parts = []
+    prev_cmd = None
+    prev_num = None
+    for cmd, args in segments:
+        # repeated commands can be omitted, except for moveto which would turn into a lineto
+        implicit = cmd == prev_cmd and cmd.upper() != "M"
+        if not implicit:
+            parts.append(cmd)
+            prev_num = None
+        for i, arg in enumerate(args):
+            num = format_number(arg, precision) if not (cmd.upper() == "A" and i in (3, 4)) else str(int(arg))
+            if prev_num is not None and not num.startswith("-") \
+                    and not (num.startswith(".") and "." in prev_num and "e" not in prev_num):
+                parts.append(" ")
+            parts.append(num)
+            prev_num = num
+        prev_cmd = cmd
+    return "".join(parts)
+
+def minify_path(d, transform=None, precision=3):
+    """Shortens the numbers in the given path data to the given precision. If a
+    'translate(x, y) scale(s)' transform is given, it is merged into the path.
+    Returns None for the transform if it was merged, or the original transform
+    otherwise."""
+    segments = parse_path(d)
+    if transform is not None:
+        m = _TRANSFORM_RE.match(transform)
+        if m is not None:
+            segments = transform_path(segments, *(float(g) for g in m.groups()))
+            transform = None
+    return format_path(segments, precision=precision), transform
+
+def _minify_node(node, precision, keep_text):
+    if isinstance(node, list):
+        return [_minify_node(n, precision, keep_text) for n in node]
+    if not isinstance(node, dict):
+        return node
+
+    if keep_text and "#text" in node and any(not key.startswith(("@", "#")) for key in node):
+        # xmltodict moves the text of mixed content in front of the child elements
+        raise ValueError("SVGs with mixed content can't be minified")
+
+    res = type(node)()
+    for key, val in node.items():
+        if key in _STRIP_KEYS:
+            continue
+        if key.startswith("@xmlns:") or key.startswith("#"):
+            # only whitespace can be dropped from arbitrary SVGs without changing them
+            if not keep_text or (key == "#text" and isinstance(val, str) and val.strip() == ""):
+                continue
+            res[key] = val
+            continue
+        if key == "path":
+            val = [_minify_path_node(n, precision) for n in val] if isinstance(val, list) \
+                else _minify_path_node(val, precision)
+        else:
+            val = _minify_node(val, precision, keep_text)
+        res[key] = val
+    return res
+
+def _minify_path_node(node, precision):
+    node = type(node)(node)
+    if "@d" not in node:
+        return node
+
+    d, transform = minify_path(node["@d"], transform=node.get("@transform"), precision=precision)
+    node["@d"] = d
+    if transform is None:
+        node.pop("@transform", None)
+    return node
+
+def minify_icon(icon: Icon, precision=3, keep_text=False) -> Icon:
+    """Returns a minified copy of the given icon. Titles and metadata are
+    stripped, path data is shortened and transforms are merged into the paths
+    where possible. The resulting icon is serialized without pretty-printing.
+    Text and namespace declarations are only safe to strip from simple-icons,
+    so pass keep_text for any other SVG."""
+    svg = _minify_node(copy.deepcopy(icon.svg), precision, keep_text)
+    return Icon(icon.title, icon.filename, svg, pretty=False, on_event=icon.on_event)
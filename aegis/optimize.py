@@ -0,0 +1,110 @@
+import binascii
+import io
+from base64 import b64decode, b64encode
+from xml.parsers import expat
+from xml.parsers.expat import ExpatError
+
+import xmltodict
+from PIL import Image, UnidentifiedImageError
+
+from aegis._format import icon_mime
+from aegis.icons import Icon
+from aegis.minify import minify_icon
+from aegis.workers import iter_batches, ordered_map
+
+FORMATS = {
+    "png": "image/png",
+    "webp": "image/webp"
+}
+
+def optimize_icon(data, mime=None, size=256, fmt="png", quality=90):
+    """Shrinks the given icon. Raster icons that are larger than size are
+    downscaled and all of them are recompressed as the given format (png or
+    webp). SVG icons are minified instead. Returns a (data, mime) tuple, which
+    is the original icon if the result wouldn't be any smaller."""
+    if fmt not in FORMATS:
+        raise ValueError("unsupported icon format: {}".format(fmt))
+
+    if mime is None:
+        mime = icon_mime(data)
+    try:
+        if mime == "image/svg+xml":
+            icon = minify_icon(Icon("", "", xmltodict.parse(data)), keep_text=True)
+            res, res_mime = icon.get_xml().encode("utf-8"), mime
+            _check_xml(res)
+        else:
+            res, res_mime = _recompress(data, size, fmt, quality), FORMATS[fmt]
+    except (ExpatError, ValueError, OSError, UnidentifiedImageError):
+        return data, mime
+
+    if len(res) >= len(data):
+        return data, mime
+    return res, res_mime
+
+def _check_xml(data):
+    # parse with namespace processing, so prefixes that lost their declaration are caught as well
+    parser = expat.ParserCreate(namespace_separator=" ")
+    parser.Parse(data, True)
+
+def _recompress(data, size, fmt, quality):
+    img = Image.open(io.BytesIO(data))
+    if img.mode not in ("RGB", "RGBA", "L", "LA"):
+        img = img.convert("RGBA")
+    if img.width > size or img.height > size:
+        img.thumbnail((size, size), Image.LANCZOS)
+
+    buf = io.BytesIO()
+    if fmt == "webp":
+        img.save(buf, format="WEBP", quality=quality, method=6)
+    else:
+        img.save(buf, format="PNG", optimize=True)
+    return buf.getvalue()
+
+def _optimize_batch(entries, size, fmt, quality):
+    # the batch may be optimized in this process, so the entries are copied before changing them
+    res_entries = []
+    before = after = 0
+    for entry in entries:
+        res_entries.append(entry)
+        if entry.get("icon") is None:
+            continue
+        try:
+            data = b64decode(entry["icon"], validate=True)
+        except (binascii.Error, TypeError, ValueError):
+            continue
+
+        res, mime = optimize_icon(data, mime=entry.get("icon_mime"), size=size, fmt=fmt, quality=quality)
+        before += len(data)
+        after += len(res)
+        if res is not data:
+            entry = res_entries[-1] = dict(entry)
+            entry["icon"] = b64encode(res).decode("utf-8")
+            entry["icon_mime"] = mime
+            entry.pop("icon_hash", None)
+    return res_entries, before, after
+
+class OptimizeStats:
+    def __init__(self):
+        self.icons_before = 0
+        self.icons_after = 0
+
+    def __str__(self):
+        saved = self.icons_before - self.icons_after
+        percent = saved / self.icons_before * 100 if self.icons_before > 0 else 0
+        return "icons: {} -> {} bytes (saved {}, {:.1f}%)".format(self.icons_before, self.icons_after, saved, percent)
+
+def optimize_entries(entries, size=256, fmt="png", quality=90, workers=None, batch_size=32, stats=None):
+    """Yields the given entries with their icons optimized by optimize_icon, in
+    the same order. Entries of which the icon changed are copies. The icons are optimized in batches,
+    spread over a pool of worker processes. The icon sizes before and after
+    are added to the given OptimizeStats."""
+    def handle(res):
+        batch, before, after = res
+        if stats is not None:
+            stats.icons_before += before
+            stats.icons_after += after
+        return batch
+
+    tasks = ((batch, size, fmt, quality) for first, batch in iter_batches(entries, batch_size))
+    for res in ordered_map(_optimize_batch, tasks, workers=workers):
+        yield from handle(res)
@@ -0,0 +1,308 @@
+import hashlib
+import os
+import time
+import zipfile
+import zlib
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+from lxml import etree
+
+from aegis import _json
+from aegis.icons import IconGenerator
+from aegis.metrics import emit
+from aegis.minify import minify_icon
+
+PACK_UUID = "6a371ea0-1178-4677-ae93-cda7a7a5b378"
+PACK_NAME = "Aegis Simple Icons"
+DELTA_MANIFEST = "delta.json"
+
+class PackError(Exception):
+    pass
+
+# A checkout of an icon set in the simple-icons layout. If metadata is None,
+# the metadata is read from data/simple-icons.json in the checkout.
+IconSource = namedtuple("IconSource", ["path", "metadata"])
+
+# A generated icon along with the size it had before it was minified.
+SourceIcon = namedtuple("SourceIcon", ["title", "filename", "data", "original_size"])
+
+# The size of a minified icon before and after, without keeping the icon itself.
+IconSize = namedtuple("IconSize", ["filename", "size", "original_size"])
+
+def parse_source(spec):
+    """Parses an icon source of the form 'path' or 'path=metadata'."""
+    path, sep, metadata = spec.partition("=")
+    return IconSource(path, metadata if sep else None)
+
+def generate_source(source, shapes=("circle",), only=None, exclude=None, precision=None, collect_events=False):
+    """Generates the given shape variants of all icons of the given source that
+    match the filters, minifying them if a precision is given. Every SVG file
+    is only parsed once for all variants. Returns a dict with a list of
+    SourceIcons for every shape and, if collect_events is set, a list of the
+    timing events."""
+    events = [] if collect_events else None
+    # minifying needs the xmltodict tree anyway, so only use the template fast path without it
+    gen = IconGenerator(
+        source.path, metadata=source.metadata, on_event=events.append if collect_events else None,
+        fast=precision is None
+    )
+
+    icons = {shape: [] for shape in shapes}
+    for variants in gen.generate_all_variants(shapes=shapes, only=only, exclude=exclude):
+        for shape, icon in variants.items():
+            original_size = None
+            if precision is not None:
+                original_size = len(icon.get_xml(record=False).encode("utf-8"))
+                icon = minify_icon(icon, precision=precision)
+            data = icon.get_xml().encode("utf-8")
+            icons[shape].append(SourceIcon(icon.title, icon.filename, data, original_size or len(data)))
+    return icons, events
+
+class PackBuilder:
+    """Builds an icon pack. Icons with byte-identical contents are only stored
+    once, with the titles of all of them merged into its list of issuers."""
+
+    def __init__(self, version, name=PACK_NAME, uuid=PACK_UUID):
+        self.pack = {
+            "uuid": uuid,
+            "name": name,
+            "version": version,
+            "icons": []
+        }
+        self.files = {}
+        self.duplicates = 0
+        self._hashes = {}
+
+    def add(self, title, filename, data):
+        digest = hashlib.sha256(data).hexdigest()
+        icon = self._hashes.get(digest)
+        if icon is not None:
+            if title not in icon["issuer"]:
+                icon["issuer"].append(title)
+            self.duplicates += 1
+            return icon
+
+        filename_zip = "SVG/" + os.path.basename(filename)
+        if filename_zip in self.files:
+            # a different icon with the same name came from another source
+            stem, ext = os.path.splitext(filename_zip)
+            filename_zip = "{}-{}{}".format(stem, digest[:8], ext)
+
+        icon = {
+            "name": title,
+            "filename": filename_zip,
+            "category": None,
+            "issuer": [title]
+        }
+        self._hashes[digest] = icon
+        self.files[filename_zip] = data
+        self.pack["icons"].append(icon)
+        return icon
+
+    def write(self, path, compact=False, on_event=None):
+        self.pack["icons"].sort(key=lambda icon: icon["filename"])
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zipf:
+            for filename, data in self.files.items():
+                start = time.perf_counter()
+                zipf.writestr(filename, data)
+                emit(on_event, "write", os.path.basename(filename), start, len(data))
+            zipf.writestr("pack.json", _json.dumps(self.pack, compact=compact))
+
+    def write_delta(self, previous, path, compact=False):
+        """Writes a delta archive against the previous version of the pack, which
+        is given as an open PackReader. It contains the new pack.json, the icon
+        files that were added or changed since the previous version and a
+        delta.json manifest that also lists the removed files. Returns the
+        manifest."""
+        old_hashes = previous.hashes()
+        base_version = previous.pack.get("version")
+
+        new_hashes = {filename: hashlib.sha256(data).hexdigest() for filename, data in self.files.items()}
+        manifest = {
+            "uuid": self.pack["uuid"],
+            "base_version": base_version,
+            "version": self.pack["version"],
+            "added": sorted(f for f in new_hashes if f not in old_hashes),
+            "changed": sorted(f for f, h in new_hashes.items() if f in old_hashes and old_hashes[f] != h),
+            "removed": sorted(f for f in old_hashes if f not in new_hashes)
+        }
+
+        self.pack["icons"].sort(key=lambda icon: icon["filename"])
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zipf:
+            for filename in manifest["added"] + manifest["changed"]:
+                zipf.writestr(filename, self.files[filename])
+            zipf.writestr("pack.json", _json.dumps(self.pack, compact=compact))
+            zipf.writestr(DELTA_MANIFEST, _json.dumps(manifest, compact=compact))
+        return manifest
+
+def build_packs(sources, version, shapes=("circle",), only=None, exclude=None, precision=None, workers=None, on_event=None):
+    """Generates the icons of all given sources and adds them to a new
+    PackBuilder for every given shape, in one pass over the sources. Multiple
+    sources are processed in parallel. Returns a dict with a (builder, sizes)
+    tuple for every shape, where sizes is a list with the IconSize of every
+    icon if a precision is given to minify them, or empty otherwise."""
+    packs = {shape: (PackBuilder(version), []) for shape in shapes}
+
+    def add(res):
+        variants, events = res
+        for event in events or []:
+            on_event(event)
+        for shape, icons in variants.items():
+            builder, sizes = packs[shape]
+            for icon in icons:
+                builder.add(icon.title, icon.filename, icon.data)
+                if precision is not None:
+                    sizes.append(IconSize(icon.filename, len(icon.data), icon.original_size))
+
+    # the icons of a source are added as soon as it's done, so only the builders keep them around
+    args = (shapes, only, exclude, precision, on_event is not None)
+    if len(sources) > 1 and (workers is None or workers > 1):
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for res in pool.map(generate_source, sources, *(repeat(arg) for arg in args)):
+                add(res)
+    else:
+        for source in sources:
+            add(generate_source(source, *args))
+    return packs
+
+class PackReader:
+    """Reads an icon pack without extracting it. Only the central directory of
+    the zip file and pack.json are read when the pack is opened, icons are
+    read on demand."""
+
+    def __init__(self, path):
+        self.path = path
+        self._zipf = zipfile.ZipFile(path, "r")
+        try:
+            self.pack = _json.loads(self._zipf.read("pack.json"))
+        except KeyError:
+            self._zipf.close()
+            raise PackError("pack.json is missing")
+        except ValueError as e:
+            self._zipf.close()
+            raise PackError("pack.json is not valid JSON: {}".format(e))
+        self._icons = {icon["filename"]: icon for icon in self.pack.get("icons", [])}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._zipf.close()
+
+    def icons(self):
+        return self.pack.get("icons", [])
+
+    def filenames(self):
+        """Returns the names of all files in the zip file, except pack.json."""
+        return [name for name in self._zipf.namelist() if name != "pack.json" and not name.endswith("/")]
+
+    def get(self, filename):
+        """Returns the pack.json entry of the given icon file, or None."""
+        return self._icons.get(filename)
+
+    def find(self, issuer):
+        """Returns the first icon that lists the given issuer, ignoring case."""
+        issuer = issuer.lower()
+        for icon in self.icons():
+            if any(i.lower() == issuer for i in icon.get("issuer", [])):
+                return icon
+        return None
+
+    def read(self, filename):
+        """Returns the contents of the given icon file."""
+        try:
+            return self._zipf.read(filename)
+        except KeyError:
+            raise PackError("{} is not in the pack".format(filename))
+
+    def hashes(self):
+        """Returns a dict with the SHA-256 hash of every icon file."""
+        return {filename: hashlib.sha256(self.read(filename)).hexdigest() for filename in self.filenames()}
+
+def apply_delta(previous_path, delta_path, path):
+    """Writes the pack that results from applying the given delta archive to
+    the given previous version of the pack. Returns the delta manifest."""
+    with zipfile.ZipFile(delta_path, "r") as delta, PackReader(previous_path) as previous:
+        try:
+            manifest = _json.loads(delta.read(DELTA_MANIFEST))
+        except KeyError:
+            raise PackError("{} is missing, this is not a delta archive".format(DELTA_MANIFEST))
+        if manifest["base_version"] != previous.pack.get("version"):
+            raise PackError("the delta applies to version {}, but the pack is version {}".format(
+                manifest["base_version"], previous.pack.get("version")
+            ))
+
+        replaced = set(manifest["changed"]) | set(manifest["removed"])
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zipf:
+            for filename in previous.filenames():
+                if filename not in replaced:
+                    zipf.writestr(filename, previous.read(filename))
+            for filename in manifest["added"] + manifest["changed"]:
+                zipf.writestr(filename, delta.read(filename))
+            zipf.writestr("pack.json", delta.read("pack.json"))
+    return manifest
+
+def _verify_icon_file(path, filenames):
+    problems = []
+    with zipfile.ZipFile(path, "r") as zipf:
+        for filename in filenames:
+            try:
+                data = zipf.read(filename)
+            except KeyError:
+                problems.append((filename, "listed in pack.json, but missing"))
+                continue
+            except (zipfile.BadZipFile, zlib.error) as e:
+                problems.append((filename, "unable to read: {}".format(e)))
+                continue
+
+            if filename.lower().endswith(".svg"):
+                try:
+                    root = etree.fromstring(data)
+                except etree.XMLSyntaxError as e:
+                    problems.append((filename, "invalid XML: {}".format(e)))
+                    continue
+                if etree.QName(root).localname != "svg":
+                    problems.append((filename, "root element is not <svg>"))
+            elif not data.startswith((b"\x89PNG\r\n\x1a\n", b"\xff\xd8\xff")):
+                problems.append((filename, "not a recognized image format"))
+    return problems
+
+def verify_pack(path, workers=None, batch_size=256):
+    """Checks that every file that is listed in pack.json of the given pack
+    exists and parses, and that there are no files that aren't listed. The
+    files are checked in parallel. Returns a list of (filename, problem)
+    tuples."""
+    problems = []
+    with PackReader(path) as reader:
+        listed = []
+        for i, icon in enumerate(reader.icons()):
+            for key in ("name", "filename", "issuer"):
+                if key not in icon:
+                    problems.append(("pack.json", "icon {} is missing {}".format(i, key)))
+            if "filename" in icon:
+                listed.append(icon["filename"])
+
+        seen = set()
+        for filename in listed:
+            if filename in seen:
+                problems.append((filename, "listed in pack.json more than once"))
+            seen.add(filename)
+        for filename in reader.filenames():
+            if filename not in seen:
+                problems.append((filename, "not listed in pack.json"))
+
+    batches = [listed[i:i + batch_size] for i in range(0, len(listed), batch_size)]
+    if len(batches) > 1 and (workers is None or workers > 1):
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = pool.map(_verify_icon_file, repeat(path), batches)
+            for res in results:
+                problems.extend(res)
+    else:
+        for batch in batches:
+            problems.extend(_verify_icon_file(path, batch))
+    return problems
@@ -0,0 +1,124 @@
+import io
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+from PIL import Image
+from qrcode import QRCode
+
+FORMATS = ("png", "svg")
+
+class QRMatrix:
+    """The modules of a QR code, including the quiet zone, as a string of
+    bytes with one byte per module: 0 for dark and 255 for light."""
+
+    def __init__(self, size, modules):
+        self.size = size
+        self.modules = modules
+
+    @classmethod
+    def encode(cls, data, border=4, mask_pattern=None):
+        """Encodes the given data. Passing a mask pattern (0-7) skips the search
+        for the best one, which makes encoding several times faster at the cost
+        of a slightly less readable code."""
+        qr = QRCode(border=border, mask_pattern=mask_pattern)
+        qr.add_data(data)
+        qr.make(fit=True)
+        matrix = qr.get_matrix()
+        modules = bytes(0 if dark else 255 for row in matrix for dark in row)
+        return cls(len(matrix), modules)
+
+    def to_image(self, scale=8):
+        # scale up the 1 pixel per module image in one go, instead of drawing every module
+        img = Image.frombytes("L", (self.size, self.size), self.modules)
+        if scale != 1:
+            img = img.resize((self.size * scale, self.size * scale), Image.NEAREST)
+        return img.convert("1")
+
+    def to_png(self, scale=8):
+        buf = io.BytesIO()
+        self.to_image(scale=scale).save(buf, format="PNG", optimize=False)
+        return buf.getvalue()
+
+    def to_svg(self, scale=8):
+        # every horizontal run of dark modules becomes a single rectangle in the path
+        parts = []
+        size = self.size
+        for y in range(size):
+            row = self.modules[y * size:(y + 1) * size]
+            x = row.find(0)
+            while x != -1:
+                end = row.find(255, x)
+                if end == -1:
+                    end = size
+                parts.append("M{},{}h{}v1h-{}z".format(x, y, end - x, end - x))
+                x = row.find(0, end)
+
+        px = size * scale
+        return (
+            '<svg xmlns="http://www.w3.org/2000/svg" width="{0}" height="{0}" viewBox="0 0 {1} {1}" shape-rendering="crispEdges">'
+            '<rect width="{1}" height="{1}" fill="#fff"/><path d="{2}" fill="#000"/></svg>'
+        ).format(px, size, "".join(parts))
+
+def _write_batch(output, fmt, scale, border, mask_pattern, batch):
+    filenames = []
+    for index, data in batch:
+        matrix = QRMatrix.encode(data, border=border, mask_pattern=mask_pattern)
+        filename = "{:06d}.{}".format(index, fmt)
+        if fmt == "svg":
+            with io.open(os.path.join(output, filename), "w") as f:
+                f.write(matrix.to_svg(scale=scale))
+        else:
+            with io.open(os.path.join(output, filename), "wb") as f:
+                f.write(matrix.to_png(scale=scale))
+        filenames.append(filename)
+    return filenames
+
+def _encode_batch(border, mask_pattern, batch):
+    return [QRMatrix.encode(data, border=border, mask_pattern=mask_pattern) for data in batch]
+
+def _batches(items, batch_size):
+    for i in range(0, len(items), batch_size):
+        yield items[i:i + batch_size]
+
+def write_images(items, output, fmt="png", scale=8, border=4, mask_pattern=None, workers=None, batch_size=64):
+    """Encodes every string in items as a QR code and writes it to a numbered
+    PNG or SVG file in the output directory, spread over a pool of worker
+    processes. Returns a list of the filenames in the same order as items."""
+    if fmt not in FORMATS:
+        raise ValueError("unsupported QR code format: {}".format(fmt))
+
+    batches = list(_batches(list(enumerate(items)), batch_size))
+    if workers == 1 or len(batches) <= 1:
+        results = [_write_batch(output, fmt, scale, border, mask_pattern, batch) for batch in batches]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(
+                _write_batch, repeat(output), repeat(fmt), repeat(scale), repeat(border), repeat(mask_pattern), batches
+            ))
+    return [filename for res in results for filename in res]
+
+def contact_sheet(items, scale=4, border=4, mask_pattern=None, columns=None, workers=None, batch_size=64):
+    """Encodes every string in items as a QR code and tiles them on a single
+    image. All codes get a cell of the size of the largest one. Returns the
+    image."""
+    items = list(items)
+    batches = list(_batches(items, batch_size))
+    if workers == 1 or len(batches) <= 1:
+        matrices = [m for batch in batches for m in _encode_batch(border, mask_pattern, batch)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            matrices = [m for res in pool.map(_encode_batch, repeat(border), repeat(mask_pattern), batches) for m in res]
+
+    if columns is None:
+        columns = max(1, math.ceil(math.sqrt(len(matrices))))
+    rows = max(1, math.ceil(len(matrices) / columns))
+    cell = max((m.size for m in matrices), default=0) * scale
+
+    sheet = Image.new("1", (columns * cell, rows * cell), 1)
+    for i, matrix in enumerate(matrices):
+        img = matrix.to_image(scale=scale)
+        offset = (cell - img.size[0]) // 2
+        sheet.paste(img, ((i % columns) * cell + offset, (i // columns) * cell + offset))
+    return sheet
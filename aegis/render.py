@@ -0,0 +1,100 @@
+import shutil
+import subprocess
+
+from lxml import etree
+from reportlab.graphics import renderPM
+from svglib.svglib import SvgRenderer
+
+DEFAULT_BACKEND = "reportlab"
+
+class RenderError(Exception):
+    pass
+
+class ReportlabBackend:
+    """Renders with svglib and reportlab's renderPM. Always available, but slow
+    and memory-hungry at large sizes."""
+
+    name = "reportlab"
+    in_process = True
+
+    @staticmethod
+    def available():
+        return True
+
+    def render(self, svg, width, height):
+        # svglib expects an lxml structure internally
+        parser = etree.XMLParser(remove_comments=True, recover=True)
+        root = etree.fromstring(svg, parser=parser)
+
+        # render the SVG to a PNG
+        renderer = SvgRenderer(None)
+        drawing = renderer.render(root)
+        scale_x = width / drawing.width
+        scale_y = height / drawing.height
+        drawing.width = width
+        drawing.height = height
+        drawing.scale(scale_x, scale_y)
+        return renderPM.drawToString(drawing, fmt="PNG")
+
+class CairoSVGBackend:
+    """Renders with CairoSVG, if it's installed."""
+
+    name = "cairosvg"
+    in_process = True
+
+    @staticmethod
+    def available():
+        # cairosvg can be installed without the cairo library it needs
+        try:
+            import cairosvg
+        except (ImportError, OSError):
+            return False
+        return True
+
+    def render(self, svg, width, height):
+        import cairosvg
+        return cairosvg.svg2png(bytestring=svg, output_width=width, output_height=height)
+
+class RsvgConvertBackend:
+    """Renders with the rsvg-convert tool of librsvg, if it's on the PATH. Every
+    render starts a new process, which costs more than the render itself for
+    icons, so it's never picked automatically."""
+
+    name = "rsvg-convert"
+    in_process = False
+
+    @staticmethod
+    def available():
+        return shutil.which("rsvg-convert") is not None
+
+    def render(self, svg, width, height):
+        res = subprocess.run(
+            ["rsvg-convert", "--format", "png", "--width", str(width), "--height", str(height)],
+            input=svg, capture_output=True
+        )
+        if res.returncode != 0:
+            raise RenderError("rsvg-convert failed: {}".format(res.stderr.decode("utf-8", errors="replace").strip()))
+        return res.stdout
+
+# all backends, from the cheapest per render to the most expensive: cairo renders in C, svglib builds a
+# reportlab drawing in Python first and rsvg-convert pays for a new process on top of every render
+BACKENDS = {backend.name: backend for backend in (CairoSVGBackend, ReportlabBackend, RsvgConvertBackend)}
+
+def available_backends():
+    """Returns the names of the backends that can be used, cheapest first."""
+    return [name for name, backend in BACKENDS.items() if backend.available()]
+
+def get_backend(name=None):
+    """Returns an instance of the backend with the given name. 'auto' picks the
+    cheapest one that is available and renders in this process, None the
+    default one."""
+    if name is None:
+        name = DEFAULT_BACKEND
+    elif name == "auto":
+        name = next(name for name in available_backends() if BACKENDS[name].in_process)
+
+    if name not in BACKENDS:
+        raise ValueError("unknown render backend: {}".format(name))
+    if not BACKENDS[name].available():
+        raise RenderError("render backend {} is not available".format(name))
+    return BACKENDS[name]()
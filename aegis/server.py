@@ -0,0 +1,189 @@
+import asyncio
+import hashlib
+import re
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from aegis.icons import IconGenerator, SHAPES
+from aegis.render import get_backend
+
+_MIME_TYPES = {
+    "svg": "image/svg+xml",
+    "png": "image/png"
+}
+
+_PATH_RE = re.compile(r"^/icons/([^/]+)\.(svg|png)$")
+
+_REASONS = {
+    200: "OK",
+    304: "Not Modified",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    500: "Internal Server Error"
+}
+
+# every worker process loads the simple-icons index once and keeps it around
+_worker_gen = None
+
+_worker_backend = None
+
+def _init_worker(path, render_backend):
+    global _worker_gen, _worker_backend
+    _worker_gen = IconGenerator(path)
+    _worker_backend = get_backend(render_backend)
+
+def _render(slug, shape, fmt, size):
+    icon = _worker_gen.generate(_worker_gen.find(slug), square=shape == "square")
+    if fmt == "svg":
+        return icon.get_xml().encode("utf-8")
+    return icon.render_png(width=size, height=size, backend=_worker_backend)
+
+class _HTTPError(Exception):
+    def __init__(self, status):
+        super().__init__(_REASONS[status])
+        self.status = status
+
+class IconServer:
+    """An HTTP server that serves icons generated by IconGenerator by slug.
+
+    Icons are available at /icons/<slug>.svg and /icons/<slug>.png. Both accept
+    a 'shape' query parameter (circle or square) and PNG icons also accept a
+    'size' parameter. Rendering is done in a pool of worker processes and the
+    results are kept in an LRU cache."""
+
+    def __init__(self, path, workers=None, cache_size=1024, default_size=256, max_size=1024, render_backend=None):
+        self._path = path
+        self._gen = IconGenerator(path)
+        self._workers = workers
+        self._render_backend = get_backend(render_backend).name
+        self._pool = None
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        self._pending = {}
+        self._default_size = default_size
+        self._max_size = max_size
+
+    async def serve_forever(self, host="127.0.0.1", port=8080):
+        self._pool = ProcessPoolExecutor(max_workers=self._workers, initializer=_init_worker, initargs=(self._path, self._render_backend))
+        try:
+            server = await asyncio.start_server(self._handle_conn, host, port)
+            async with server:
+                await server.serve_forever()
+        finally:
+            self._pool.shutdown(cancel_futures=True)
+
+    async def get_icon(self, slug, shape="circle", fmt="svg", size=None):
+        """Returns a (body, etag) tuple for the given icon, rendering it if it's
+        not in the cache yet. Concurrent requests for the same icon share a
+        single render."""
+        if self._gen.find(slug) is None:
+            raise _HTTPError(404)
+        if shape not in SHAPES or fmt not in _MIME_TYPES:
+            raise _HTTPError(400)
+        if fmt == "svg":
+            size = None
+        elif size is None:
+            size = self._default_size
+        elif not 0 < size <= self._max_size:
+            raise _HTTPError(400)
+
+        key = (slug, shape, fmt, size)
+        res = self._cache.get(key)
+        if res is not None:
+            self._cache.move_to_end(key)
+            return res
+
+        fut = self._pending.get(key)
+        if fut is None:
+            fut = asyncio.ensure_future(self._render(key))
+            self._pending[key] = fut
+            fut.add_done_callback(lambda _: self._pending.pop(key, None))
+        return await asyncio.shield(fut)
+
+    async def _render(self, key):
+        loop = asyncio.get_running_loop()
+        body = await loop.run_in_executor(self._pool, _render, *key)
+        res = (body, '"{}"'.format(hashlib.sha256(body).hexdigest()[:32]))
+        self._cache[key] = res
+        if len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+        return res
+
+    async def _handle_conn(self, reader, writer):
+        try:
+            while True:
+                req = await self._read_request(reader)
+                if req is None:
+                    break
+
+                method, target, headers = req
+                keep_alive = headers.get("connection", "").lower() != "close"
+                status, resp_headers, body = await self._handle_request(method, target, headers)
+
+                resp_headers["Content-Length"] = str(len(body))
+                resp_headers["Connection"] = "keep-alive" if keep_alive else "close"
+                lines = ["HTTP/1.1 {} {}".format(status, _REASONS[status])]
+                lines += ["{}: {}".format(k, v) for k, v in resp_headers.items()]
+                writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+                if method != "HEAD":
+                    writer.write(body)
+                await writer.drain()
+
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_request(reader):
+        line = await reader.readline()
+        if not line:
+            return None
+
+        parts = line.decode("latin-1").split()
+        if len(parts) != 3:
+            raise ValueError("malformed request line")
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            key, _, val = line.decode("latin-1").partition(":")
+            headers[key.strip().lower()] = val.strip()
+
+        return parts[0], parts[1], headers
+
+    async def _handle_request(self, method, target, headers):
+        if method not in ("GET", "HEAD"):
+            return 405, {"Allow": "GET, HEAD"}, b""
+
+        url = urlsplit(target)
+        m = _PATH_RE.match(url.path)
+        if m is None:
+            return 404, {}, b""
+
+        query = parse_qs(url.query)
+        try:
+            size = int(query["size"][0]) if "size" in query else None
+            shape = query.get("shape", ["circle"])[0]
+            body, etag = await self.get_icon(unquote(m.group(1)), shape=shape, fmt=m.group(2), size=size)
+        except ValueError:
+            return 400, {}, b""
+        except _HTTPError as e:
+            return e.status, {}, b""
+        except Exception:
+            return 500, {}, b""
+
+        resp_headers = {
+            "Content-Type": _MIME_TYPES[m.group(2)],
+            "ETag": etag,
+            "Cache-Control": "public, max-age=86400"
+        }
+        if etag in (tag.strip() for tag in headers.get("if-none-match", "").split(",")):
+            return 304, resp_headers, b""
+        return 200, resp_headers, body
@@ -0,0 +1,66 @@
+import io
+import os
+import secrets
+
+from aegis import _json
+from aegis.vault import create_password_slot, decrypt_vault, dump_encrypted_vault, iter_projected_entries, VaultError
+from aegis.workers import ordered_map
+
+SHARD_FORMAT = "shard-{:05d}.json"
+
+def _encrypt_shard(path, db, entries, password, compact):
+    # every shard has its own master key, so a password slot has to be derived for each of them
+    master_key = secrets.token_bytes(32)
+    slots = [create_password_slot(master_key, password)]
+    with io.open(path, "wb") as f:
+        dump_encrypted_vault(f, db, entries, master_key, slots, compact=compact)
+    return path, len(entries), os.path.getsize(path)
+
+def split_vault(db, output, shards, password, workers=None, compact=False):
+    """Splits the entries of the given vault database into the given amount of
+    consecutive shards and writes every shard to its own encrypted vault in
+    the output directory. Every shard has its own master key and password
+    slot, and the rest of the database is copied to all of them. The shards
+    are encrypted in parallel. Returns a list of (path, entries, size)
+    tuples."""
+    entries = db["entries"]
+    skel = dict(db, entries=[])
+    shards = max(1, min(shards, len(entries)))
+    size, rest = divmod(len(entries), shards)
+
+    tasks = []
+    start = 0
+    for i in range(shards):
+        end = start + size + (1 if i < rest else 0)
+        tasks.append((os.path.join(output, SHARD_FORMAT.format(i)), skel, entries[start:end], password, compact))
+        start = end
+    return list(ordered_map(_encrypt_shard, tasks, workers=workers if shards > 1 else 1))
+
+def _decrypt_shard(path, password):
+    with io.open(path, "rb") as f:
+        data = _json.loads(f.read())
+    if not isinstance(data.get("db"), str):
+        raise VaultError("{} is not an encrypted vault".format(path))
+    return decrypt_vault(data, password)
+
+def shard_paths(path):
+    """Returns the shards in the given directory, in order."""
+    return sorted(os.path.join(path, name) for name in os.listdir(path) if name.startswith("shard-") and name.endswith(".json"))
+
+def join_vault(paths, password, workers=None):
+    """Decrypts the given shards in parallel. Returns the database of the first
+    shard without its entries and an iterator that yields the entries of all
+    shards in order, parsing them one at a time."""
+    if len(paths) == 0:
+        raise ValueError("no shards to join")
+    # at most twice the amount of workers of decrypted shards are kept in memory
+    tasks = ((path, password) for path in paths)
+    dbs = ordered_map(_decrypt_shard, tasks, workers=workers if len(paths) > 1 else 1)
+    first = next(dbs)
+    skel = dict(_json.loads(first), entries=[])
+
+    def entries():
+        yield from iter_projected_entries(first)
+        for db in dbs:
+            yield from iter_projected_entries(db)
+    return skel, entries()
@@ -0,0 +1,109 @@
+import re
+import uuid
+from urllib.parse import parse_qs, unquote, urlencode, urlsplit, quote as urlquote
+
+from aegis._format import ALGORITHMS
+
+URI_TYPES = ("totp", "hotp", "steam")
+
+_BASE32_RE = re.compile(r"^[A-Z2-7]+$")
+
+class URIError(Exception):
+    pass
+
+def entry_to_uri(entry) -> str:
+    """Returns the otpauth URI of the given vault entry."""
+    info = entry["info"]
+    params = {
+        "secret": info["secret"],
+        "issuer": entry["issuer"],
+        "algorithm": info["algo"],
+        "digits": info["digits"]
+    }
+    if entry["type"] == "hotp":
+        params["counter"] = info["counter"]
+    else:
+        params["period"] = info["period"]
+
+    uri = "otpauth://{}/{}:{}?".format(entry["type"], urlquote(entry["issuer"], safe=""), urlquote(entry["name"], safe=""))
+    return uri + urlencode(params)
+
+def parse_uri(uri) -> dict:
+    """Parses the given otpauth URI into a vault entry with the same layout as
+    the ones produced by VaultGenerator.generate_entry. Raises a URIError if
+    the URI is invalid."""
+    url = urlsplit(uri.strip())
+    if url.scheme != "otpauth":
+        raise URIError("not an otpauth URI")
+
+    entry_type = url.netloc.lower()
+    if entry_type not in URI_TYPES:
+        raise URIError("unsupported type: {}".format(url.netloc))
+
+    try:
+        query = {key: vals[-1] for key, vals in parse_qs(url.query, strict_parsing=True).items()}
+    except ValueError:
+        raise URIError("malformed query string")
+
+    # the label is either 'issuer:name' or just 'name', split before unquoting so that encoded colons stay put
+    label = url.path.lstrip("/")
+    issuer, sep, name = label.partition(":")
+    if not sep:
+        issuer, name = "", label
+    issuer = query.get("issuer", unquote(issuer)).strip()
+    name = unquote(name).strip()
+
+    secret = query.get("secret", "").replace(" ", "").rstrip("=").upper()
+    if not _BASE32_RE.match(secret):
+        raise URIError("secret is missing or not valid base32")
+
+    algo = query.get("algorithm", "SHA1").upper()
+    if algo not in ALGORITHMS:
+        raise URIError("unsupported algorithm: {}".format(algo))
+
+    info = {
+        "secret": secret,
+        "algo": algo,
+        "digits": _parse_int(query, "digits", 5 if entry_type == "steam" else 6)
+    }
+    if entry_type == "hotp":
+        if "counter" not in query:
+            raise URIError("counter is missing")
+        info["counter"] = _parse_int(query, "counter", 0, minimum=0)
+    else:
+        info["period"] = _parse_int(query, "period", 30)
+
+    return {
+        "type": entry_type,
+        "uuid": str(uuid.uuid4()),
+        "name": name,
+        "issuer": issuer,
+        "icon": None,
+        "info": info
+    }
+
+def _parse_int(query, key, default, minimum=1):
+    if key not in query:
+        return default
+    try:
+        value = int(query[key])
+    except ValueError:
+        raise URIError("{} is not a number".format(key))
+    if value < minimum:
+        raise URIError("{} is out of range".format(key))
+    return value
+
+def iter_uri_entries(lines, errors=None):
+    """Parses the otpauth URIs in the given iterable of lines one by one and
+    yields an entry for every valid one. Blank lines and lines starting with #
+    are skipped. Invalid lines are reported to the errors callback, which is
+    called with the line number and the error."""
+    for lineno, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            yield parse_uri(line)
+        except URIError as e:
+            if errors is not None:
+                errors(lineno, e)
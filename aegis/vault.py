@@ -1,7 +1,17 @@
 import base64
+import io
+import math
+import os
 import secrets
+import time
 import uuid
+from collections import deque
+from aegis import _json
+from aegis._format import iter_raw_entries
 from aegis.icons import IconGenerator
+from aegis.metrics import emit
+from aegis.render import get_backend
+from aegis.workers import InlineRenderPool, RenderPool
 from base64 import b32encode, b64encode
 
 from ._data import names as _names, issuers as _issuers
@@ -14,6 +24,10 @@ backend = default_backend()
 class VaultError(Exception):
     pass
 
+SCRYPT_N = 1 << 15
+SCRYPT_R = 8
+SCRYPT_P = 1
+
 def _decrypt(ct, key, nonce, safe=True):
     cipher = Cipher(algorithms.AES(key), modes.GCM(nonce), backend)
     decryptor = cipher.decryptor()
@@ -22,53 +36,303 @@ def _decrypt(ct, key, nonce, safe=True):
         pt += decryptor.finalize_with_tag(ct[len(ct) - 16:])
     return pt
 
-def decrypt_vault(data, password, safe=True):
-    # extract all password slots from the header
-    header = data["header"]
+def _encrypt(pt, key, nonce):
+    cipher = Cipher(algorithms.AES(key), modes.GCM(nonce), backend)
+    encryptor = cipher.encryptor()
+    ct = encryptor.update(pt) + encryptor.finalize()
+    return ct, encryptor.tag
+
+def _derive_key(password, salt, n, r, p):
+    kdf = Scrypt(
+        salt=salt,
+        length=32,
+        n=n,
+        r=r,
+        p=p,
+        backend=backend
+    )
+    return kdf.derive(password.encode("utf-8"))
+
+def slot_id(slot):
+    """Returns an identifier for the given slot that changes whenever the
+    master key is re-wrapped with a new salt."""
+    return "{}:{}".format(slot["uuid"], slot["salt"])
+
+def unwrap_master_key(header, password, safe=True):
+    """Tries the given password on every password slot in the given vault
+    header. Returns a (slot, master_key) tuple for the first one that
+    succeeds."""
     slots = [slot for slot in header["slots"] if slot["type"] == 1]
 
-    # try the given password on every slot until one succeeds
-    master_key = None
     for slot in slots:
         # derive a key from the given password
-        kdf = Scrypt(
-            salt=bytes.fromhex(slot["salt"]),
-            length=32,
-            n=slot["n"],
-            r=slot["r"],
-            p=slot["p"],
-            backend=backend
-        )
-        key = kdf.derive(password.encode("utf-8"))
+        key = _derive_key(password, bytes.fromhex(slot["salt"]), slot["n"], slot["r"], slot["p"])
 
         # try to use the derived key to decrypt the master key
         params = slot["key_params"]
         try:
             ct = bytes.fromhex(slot["key"]) + bytes.fromhex(params["tag"])
-            master_key = _decrypt(ct, key, bytes.fromhex(params["nonce"]), safe=safe)
+            return slot, _decrypt(ct, key, bytes.fromhex(params["nonce"]), safe=safe)
         except cryptography.exceptions.InvalidTag:
             pass
 
+    raise VaultError("unable to decrypt the master key with the given password")
+
+def decrypt_vault(data, password=None, safe=True, master_key=None):
+    """Decrypts the given vault with the given password, or with an already
+    unwrapped master key, which skips the key derivation."""
+    header = data["header"]
     if master_key is None:
-        raise VaultError("unable to decrypt the master key with the given password")
+        master_key = unwrap_master_key(header, password, safe=safe)[1]
 
     # decode the base64 vault contents
     content = base64.b64decode(data["db"])
 
     # decrypt the vault contents using the master key
     params = header["params"]
-    db = _decrypt(content + bytes.fromhex(params["tag"]), master_key, bytes.fromhex(params["nonce"]), safe=safe)
+    try:
+        db = _decrypt(content + bytes.fromhex(params["tag"]), master_key, bytes.fromhex(params["nonce"]), safe=safe)
+    except cryptography.exceptions.InvalidTag:
+        raise VaultError("unable to decrypt the vault with the given master key")
     return db.decode("utf-8", errors="strict" if safe else "replace")
 
+def create_password_slot(master_key, password, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P):
+    """Returns a password slot that wraps the given master key with a key
+    derived from the given password."""
+    salt = secrets.token_bytes(32)
+    key = _derive_key(password, salt, n, r, p)
+    nonce = secrets.token_bytes(12)
+    ct, tag = _encrypt(master_key, key, nonce)
+    return {
+        "type": 1,
+        "uuid": str(uuid.uuid4()),
+        "key": ct.hex(),
+        "key_params": {
+            "nonce": nonce.hex(),
+            "tag": tag.hex()
+        },
+        "n": n,
+        "r": r,
+        "p": p,
+        "salt": salt.hex(),
+        "repaired": True,
+        "is_backup": False
+    }
+
+ICON_FIELDS = ("icon", "icon_mime", "icon_hash")
+
+def project_entry(entry, fields=None, drop_icons=False):
+    """Returns a copy of the given entry with only the given fields. Nested
+    fields are separated by dots (e.g. info.secret). Fields the entry doesn't
+    have are left out."""
+    if fields is None:
+        res = dict(entry)
+    else:
+        res = {}
+        for field in fields:
+            src, dst = entry, res
+            keys = field.split(".")
+            for key in keys[:-1]:
+                src = src.get(key)
+                if not isinstance(src, dict):
+                    break
+                dst = dst.setdefault(key, {})
+            else:
+                if keys[-1] in src:
+                    dst[keys[-1]] = src[keys[-1]]
+
+    if drop_icons:
+        for key in ICON_FIELDS:
+            res.pop(key, None)
+    return res
+
+def iter_projected_entries(db, fields=None, drop_icons=False, skeleton=None):
+    """Parses the entries of the given decrypted vault database one at a time
+    and yields their projections (see project_entry), instead of parsing the
+    whole database with all of its icons at once. If skeleton is a list, the
+    database without its entries is appended to it once all entries have been
+    yielded."""
+    if isinstance(db, str):
+        db = db.encode("utf-8")
+
+    raw_skeleton = [] if skeleton is not None else None
+    for raw in iter_raw_entries(io.BytesIO(db), skeleton=raw_skeleton):
+        yield project_entry(_json.loads(raw), fields=fields, drop_icons=drop_icons)
+    if skeleton is not None:
+        skeleton.append(_json.loads(raw_skeleton[0]))
+
+# the issuer list has a lot of duplicates
+_unique_issuers = list(dict.fromkeys(_issuers))
+
+def _unique_name(index, names=_names):
+    # every index gets a different name: the plain names first, then numbered ones
+    num, i = divmod(index, len(names))
+    return names[i] if num == 0 else "{} {}".format(names[i], num + 1)
+
+def unique_pairs(count, issuers, names=_names):
+    """Yields count (issuer, name) tuples in random order, without any
+    duplicate pairs as long as the given issuers are unique. Every issuer is
+    used once before any of them is used again, and names get a number once
+    the plain ones run out. The pairs are numbered and the numbers are
+    shuffled with a random affine permutation, so this takes constant time
+    per pair and no memory beyond a copy of the issuers and names, regardless of the
+    count."""
+    if count <= 0:
+        return
+
+    # shuffle the issuers and names too, or small counts would always get the first ones
+    issuers, names = list(issuers), list(names)
+    secrets.SystemRandom().shuffle(issuers)
+    secrets.SystemRandom().shuffle(names)
+
+    # a * k + b mod count visits every number below count once if a and count are coprime
+    a = secrets.randbelow(count) or 1
+    while math.gcd(a, count) != 1:
+        a = secrets.randbelow(count) or 1
+    b = secrets.randbelow(count)
+
+    for k in range(count):
+        index = (a * k + b) % count
+        name_index, issuer_index = divmod(index, len(issuers))
+        yield issuers[issuer_index], _unique_name(name_index, names)
+
+ICON_FORMATS = {
+    "png": "image/png",
+    "svg": "image/svg+xml"
+}
+
+# every render worker process has its own generator to render icons with
+_worker_gen = None
+_worker_events = None
+
+def _init_worker(simple_icons, icon_format, icon_size, render_backend, collect_events):
+    global _worker_gen, _worker_events
+    _worker_events = [] if collect_events else None
+    on_event = _worker_events.append if collect_events else None
+    _worker_gen = VaultGenerator(
+        simple_icons=simple_icons, icon_format=icon_format, icon_size=icon_size,
+        render_backend=render_backend, on_event=on_event
+    )
+
+def _render_icon(icon):
+    # the events of a render are sent back to the parent along with the icon
+    res = _worker_gen.encode_icon(_worker_gen._icon_gen.generate(icon))
+    if _worker_events is None:
+        return res, None
+    events = list(_worker_events)
+    _worker_events.clear()
+    return res, events
+
+class _EncryptingWriter:
+    """Encrypts everything that is written to it with AES-GCM and writes the
+    base64 encoded ciphertext to the underlying binary file."""
+
+    def __init__(self, f, key, nonce, on_event=None):
+        self._f = f
+        self._encryptor = Cipher(algorithms.AES(key), modes.GCM(nonce), backend).encryptor()
+        self._rest = b""
+        self._on_event = on_event
+
+    def write(self, data):
+        start = time.perf_counter()
+        data = self._rest + self._encryptor.update(data)
+        # only encode whole groups of 3 bytes, so that no padding ends up in the middle
+        n = len(data) - len(data) % 3
+        self._rest = data[n:]
+        self._f.write(b64encode(data[:n]))
+        emit(self._on_event, "encrypt", None, start, n)
+
+    def finalize(self):
+        self._f.write(b64encode(self._rest + self._encryptor.finalize()))
+        return self._encryptor.tag
+
+def _dump_entries(f, obj, entries, compact=False, on_event=None):
+    # obj contains an empty entries list, which is swapped out for the given entries
+    data = _json.dumps(obj, compact=compact)
+    marker = b'"entries":[]' if compact else b'"entries": []'
+    prefix, suffix = data.split(marker, 1)
+    if compact:
+        sep, open_, close = b",", b"[", b"]"
+    else:
+        # the entries are indented one level deeper than the key of the list
+        key_indent = prefix[prefix.rfind(b"\n") + 1:]
+        indent = key_indent + b" " * 4
+        sep, open_, close = b",\n", b"[\n", b"\n" + key_indent + b"]"
+
+    f.write(prefix + marker[:-2])
+    first = True
+    for entry in entries:
+        start = time.perf_counter()
+        data = _json.dumps(entry, compact=compact)
+        if not compact:
+            data = b"\n".join(indent + line for line in data.split(b"\n"))
+        # issuers aren't unique, so entries are left out of the slowest list
+        emit(on_event, "encode", None, start, len(data))
+
+        start = time.perf_counter()
+        f.write((open_ if first else sep) + data)
+        emit(on_event, "write", None, start, len(data))
+        first = False
+    f.write(b"[]" if first else close)
+    f.write(suffix)
+
+def dump_vault(f, vault, entries, compact=False, on_event=None):
+    """Writes the given vault to the binary file f, with the entries taken from
+    the given iterable instead of from the vault itself. This allows writing
+    vaults with a lot of entries without keeping all of them in memory. The
+    optional on_event callback receives serialize and write events."""
+    skel = dict(vault)
+    skel["db"] = dict(vault["db"], entries=[])
+    _dump_entries(f, skel, entries, compact=compact, on_event=on_event)
+
+def dump_db(f, db, entries, compact=False, on_event=None):
+    """Like dump_vault, but for a plain vault database."""
+    _dump_entries(f, dict(db, entries=[]), entries, compact=compact, on_event=on_event)
+
+def dump_encrypted_vault(f, db, entries, master_key, slots, compact=False, on_event=None):
+    """Like dump_vault, but encrypts the given vault database with the given
+    master key on the fly. Nothing but the current entry is kept in memory. As
+    the authentication tag is only known at the end, the header is written
+    after the database."""
+    nonce = secrets.token_bytes(12)
+    data = _json.dumps({"version": 1, "db": ""}, compact=compact)
+    f.write(data[:data.rindex(b'""') + 1])
+
+    writer = _EncryptingWriter(f, master_key, nonce, on_event=on_event)
+    _dump_entries(writer, dict(db, entries=[]), entries, compact=True, on_event=on_event)
+    tag = writer.finalize()
+
+    header = {
+        "slots": slots,
+        "params": {
+            "nonce": nonce.hex(),
+            "tag": tag.hex()
+        }
+    }
+    # drop the opening brace of the object, so that the header key continues the vault object
+    f.write(b'",' + _json.dumps({"header": header}, compact=compact)[1:])
+
 class VaultGenerator:
-    def __init__(self, simple_icons: str=None):
-        self._icon_gen = None if simple_icons is None else IconGenerator(simple_icons)
+    def __init__(self, simple_icons: str=None, icon_format: str="png", icon_size: int=800, render_backend: str=None, on_event=None):
+        """The render_backend is the name of the aegis.render backend to render
+        PNG icons with ('auto' picks the cheapest one that is available)."""
+        if icon_format not in ICON_FORMATS:
+            raise ValueError("unsupported icon format: {}".format(icon_format))
+
+        self._on_event = on_event
+        self._simple_icons = simple_icons
+        self._icon_gen = None if simple_icons is None else IconGenerator(simple_icons, on_event=on_event)
+        self._icon_format = icon_format
+        self._icon_size = icon_size
+        self._render_backend = get_backend(render_backend) if icon_format == "png" else None
 
-    def generate(self, entry_count=20):
-        entries = []
-        for i in range(entry_count):
-            entries.append(self.generate_entry())
+    def generate(self, entry_count=20, workers=1, unique=False):
+        vault = self.generate_empty()
+        vault["db"]["entries"] = list(self.generate_entries(entry_count, workers=workers, unique=unique))
+        return vault
 
+    @staticmethod
+    def generate_empty():
         return {
             "version": 1,
             "header": {
@@ -77,28 +341,113 @@ class VaultGenerator:
             },
             "db": {
                 "version": 1,
-                "entries": entries
+                "entries": []
             }
         }
 
-    def generate_entry(self):
+    def generate_entries(self, entry_count=20, workers=1, queue_size=None, max_renders=None, max_rss=None, stats=None, unique=False):
+        """Yields the given amount of entries. If the generator has icons and
+        more than one worker is requested, the icons are rendered in a pool of
+        worker processes while the entries themselves are produced in this
+        process. Entries are still yielded in order and at most queue_size of
+        them are in flight at any time, so memory usage stays bounded. Passing
+        None for workers uses one worker per CPU.
+
+        Workers are recycled after max_renders renders or once their RSS
+        exceeds max_rss bytes. Setting either also moves rendering to a worker
+        process if only one worker is requested, otherwise a single worker
+        renders in this process. SVG icons are always encoded in this process. Either way, entries of which the icon failed
+        to render are yielded without an icon and the failure is recorded in
+        the given RenderStats.
+
+        If unique is set, no two entries have the same issuer and name, see
+        unique_pairs."""
+        if workers is None:
+            workers = os.cpu_count() or 1
+        choices = self._choices(entry_count, unique)
+        if self._icon_gen is None:
+            for issuer, name, icon in choices:
+                yield self.generate_entry(issuer, name, icon)
+            return
+
+        pending = deque()
+        def produce():
+            for issuer, name, icon in choices:
+                icon = icon or self._icon_gen.choose_random()
+                pending.append(self._new_entry(issuer or icon["title"], name))
+                yield (icon,)
+
+        # SVG icons aren't rasterized, so sending them to a worker costs more than encoding them here
+        if self._icon_format == "svg" or (workers <= 1 and max_renders is None and max_rss is None):
+            pool = InlineRenderPool(lambda icon: (self.encode_icon(self._icon_gen.generate(icon)), None), stats=stats)
+        else:
+            render_backend = self._render_backend.name if self._render_backend is not None else None
+            initargs = (self._simple_icons, self._icon_format, self._icon_size, render_backend, self._on_event is not None)
+            pool = RenderPool(
+                _render_icon, initializer=_init_worker, initargs=initargs, workers=workers,
+                max_tasks=max_renders, max_rss=max_rss, stats=stats
+            )
+        for res in pool.imap(produce(), queue_size=queue_size):
+            entry = pending.popleft()
+            if res.error is None:
+                icon, events = res.value
+                for event in events or []:
+                    self._on_event(event)
+                self._finish_entry(entry, icon)
+            yield entry
+
+    def _choices(self, entry_count, unique):
+        # yields the issuer, name and icon metadata of every entry, or None to pick them at random
+        if not unique:
+            for i in range(entry_count):
+                yield None, None, None
+            return
+
+        if self._icon_gen is None:
+            for issuer, name in unique_pairs(entry_count, _unique_issuers):
+                yield issuer, name, None
+            return
+
+        # the issuer of an entry is the title of its icon
+        table = list({icon["title"]: icon for icon in self._icon_gen.select()}.values())
+        for icon, name in unique_pairs(entry_count, table):
+            yield icon["title"], name, icon
+
+    def generate_entry(self, issuer=None, name=None, icon=None):
+        """Generates an entry with the given issuer and name, or random ones. If
+        the generator has icons, the icon is generated from the given
+        simple-icons metadata, or a random icon, and the issuer defaults to its
+        title."""
         if not self._icon_gen:
-            icon = None
-            issuer = secrets.choice(_issuers)
+            return self._new_entry(issuer or secrets.choice(_issuers), name)
+
+        # generate an icon and, unless SVG output was requested, render it to PNG
+        icon = self._icon_gen.generate(icon or self._icon_gen.choose_random())
+        entry = self._new_entry(issuer or icon.title, name)
+        return self._finish_entry(entry, self.encode_icon(icon))
+
+    def encode_icon(self, icon):
+        if self._icon_format == "svg":
+            data = icon.get_xml().encode("utf-8")
         else:
-            # generate a random icon and render it to PNG
-            rnd_icon = self._icon_gen.generate_random()
-            icon = b64encode(rnd_icon.render_png()).decode("utf-8")
-            issuer = rnd_icon.title
+            data = icon.render_png(width=self._icon_size, height=self._icon_size, backend=self._render_backend)
+        return b64encode(data).decode("utf-8")
+
+    def _finish_entry(self, entry, icon):
+        entry["icon"] = icon
+        entry["icon_mime"] = ICON_FORMATS[self._icon_format]
+        return entry
 
+    @staticmethod
+    def _new_entry(issuer, name=None):
         # generate a random 128-bit secret
         secret = b32encode(secrets.token_bytes(16)).decode("utf-8").rstrip("=")
-        entry = {
+        return {
             "type": "totp",
             "uuid": str(uuid.uuid4()),
-            "name": secrets.choice(_names),
+            "name": name or secrets.choice(_names),
             "issuer": issuer,
-            "icon": icon,
+            "icon": None,
             "info": {
                 "secret": secret,
                 "algo": "SHA1",
@@ -106,7 +455,3 @@ class VaultGenerator:
                 "period": 30
             }
         }
-        if icon is not None:
-            entry["icon_mime"] = "image/png"
-
-        return entry
@@ -0,0 +1,232 @@
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.connection import wait
+
+RenderResult = namedtuple("RenderResult", ["value", "error"])
+
+def _rss():
+    """Returns the current resident set size of this process in bytes."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except (OSError, IndexError, ValueError):
+        # fall back to the peak RSS on platforms without procfs
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == "darwin" else rss * 1024
+
+def _worker_main(conn, func, initializer, initargs, max_tasks, max_rss):
+    if initializer is not None:
+        initializer(*initargs)
+
+    count = 0
+    while True:
+        task = conn.recv()
+        if task is None:
+            break
+
+        task_id, args = task
+        try:
+            value, error = func(*args), None
+        except Exception as e:
+            value, error = None, "{}: {}".format(type(e).__name__, e)
+
+        count += 1
+        rss = _rss()
+        retire = (max_tasks is not None and count >= max_tasks) or (max_rss is not None and rss >= max_rss)
+        conn.send((task_id, value, error, rss, retire))
+        if retire:
+            break
+
+def iter_batches(items, batch_size):
+    """Yields (index of the first item, batch) tuples with lists of at most
+    batch_size of the given items, without reading more than one batch ahead."""
+    batch = []
+    first = 0
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield first, batch
+            first += len(batch)
+            batch = []
+    if len(batch) > 0:
+        yield first, batch
+
+def ordered_map(func, tasks, workers=None):
+    """Yields the result of calling func for every tuple of arguments in tasks,
+    in order, spread over a pool of worker processes. At most twice the amount
+    of workers of tasks are pending at any time, so tasks can be a lazy
+    iterable of large batches. Passing None for workers uses one worker per
+    CPU, a single worker calls func in this process."""
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1:
+        for args in tasks:
+            yield func(*args)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for args in tasks:
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+            pending.append(pool.submit(func, *args))
+        while len(pending) > 0:
+            yield pending.popleft().result()
+
+class RenderStats:
+    """Statistics of a RenderPool. Failures are kept as (args, error) tuples."""
+
+    def __init__(self):
+        self.renders = 0
+        self.failures = []
+        self.recycled = 0
+        self.peak_rss = 0
+        self.elapsed = 0
+
+    def summary(self):
+        rate = self.renders / self.elapsed if self.elapsed > 0 else 0
+        return "rendered {} icons in {:.1f}s ({:.1f}/s), {} failed, {} workers recycled, peak worker RSS {:.1f} MiB".format(
+            self.renders, self.elapsed, rate, len(self.failures), self.recycled, self.peak_rss / 1024 / 1024
+        )
+
+class InlineRenderPool:
+    """Calls func for every task in this process instead, with the same results
+    and statistics as a RenderPool. Workers aren't recycled, so it's only
+    meant for a single worker without any limits."""
+
+    def __init__(self, func, stats=None):
+        self._func = func
+        self.stats = stats if stats is not None else RenderStats()
+
+    def imap(self, tasks, queue_size=None):
+        """Yields a RenderResult for every tuple of arguments in tasks, in order."""
+        start = time.perf_counter()
+        for args in tasks:
+            try:
+                value, error = self._func(*args), None
+            except Exception as e:
+                value, error = None, "{}: {}".format(type(e).__name__, e)
+
+            self.stats.renders += 1
+            self.stats.peak_rss = max(self.stats.peak_rss, _rss())
+            if error is not None:
+                self.stats.failures.append((args, error))
+            self.stats.elapsed = time.perf_counter() - start
+            yield RenderResult(value, error)
+
+class _Worker:
+    def __init__(self, pool):
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=_worker_main,
+            args=(child_conn, pool._func, pool._initializer, pool._initargs, pool._max_tasks, pool._max_rss),
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.task_id = None
+        self.args = None
+
+    def close(self):
+        try:
+            self.conn.send(None)
+        except (OSError, EOFError):
+            pass
+        self.process.join()
+        self.conn.close()
+
+class RenderPool:
+    """A pool of worker processes that call func for every task. Workers are
+    replaced with fresh processes after max_tasks tasks or once their RSS
+    exceeds max_rss bytes, which keeps memory leaks in the rendering libraries
+    in check. A task that raises an exception, or whose worker dies, results in
+    a RenderResult with an error instead of stopping the pool."""
+
+    def __init__(self, func, initializer=None, initargs=(), workers=None, max_tasks=None, max_rss=None, stats=None):
+        self._func = func
+        self._initializer = initializer
+        self._initargs = initargs
+        self._workers = workers or multiprocessing.cpu_count()
+        self._max_tasks = max_tasks
+        self._max_rss = max_rss
+        self.stats = stats if stats is not None else RenderStats()
+
+    def imap(self, tasks, queue_size=None):
+        """Yields a RenderResult for every tuple of arguments in tasks, in order.
+        At most queue_size tasks are in flight at any time."""
+        queue_size = max(queue_size or 4 * self._workers, self._workers)
+        workers = [_Worker(self) for i in range(self._workers)]
+        idle = list(workers)
+        results = {}
+        next_id = 0
+        next_yield = 0
+        exhausted = False
+        start = time.perf_counter()
+
+        try:
+            it = iter(tasks)
+            while True:
+                while not exhausted and len(idle) > 0 and next_id - next_yield < queue_size:
+                    try:
+                        args = next(it)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    worker = idle.pop()
+                    worker.task_id = next_id
+                    worker.args = args
+                    worker.conn.send((next_id, args))
+                    next_id += 1
+
+                while next_yield in results:
+                    res = results.pop(next_yield)
+                    next_yield += 1
+                    self.stats.elapsed = time.perf_counter() - start
+                    yield res
+
+                if exhausted and next_yield == next_id:
+                    break
+                if len(idle) > 0 and not exhausted and next_id - next_yield < queue_size:
+                    continue
+
+                busy = [w for w in workers if w.task_id is not None]
+                wait([w.conn for w in busy] + [w.process.sentinel for w in busy])
+                for worker in busy:
+                    if worker.conn.poll():
+                        try:
+                            task_id, value, error, rss, retire = worker.conn.recv()
+                            self.stats.peak_rss = max(self.stats.peak_rss, rss)
+                        except EOFError:
+                            task_id, value, error, retire = worker.task_id, None, self._died(worker), True
+                    elif not worker.process.is_alive():
+                        task_id, value, error, retire = worker.task_id, None, self._died(worker), True
+                    else:
+                        continue
+
+                    self.stats.renders += 1
+                    if error is not None:
+                        self.stats.failures.append((worker.args, error))
+                    results[task_id] = RenderResult(value, error)
+                    worker.task_id = None
+                    worker.args = None
+                    if retire:
+                        worker.close()
+                        self.stats.recycled += 1
+                        workers[workers.index(worker)] = worker = _Worker(self)
+                    idle.append(worker)
+        finally:
+            for worker in workers:
+                if worker.task_id is not None:
+                    worker.process.terminate()
+                worker.close()
+            self.stats.elapsed = time.perf_counter() - start
+
+    @staticmethod
+    def _died(worker):
+        worker.process.join()
+        return "worker died with exit code {}".format(worker.process.exitcode)
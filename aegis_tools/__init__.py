@@ -1,95 +1,593 @@
 import argparse
+import asyncio
+import contextlib
 import getpass
 import io
 import json
 import os
 import zipfile
 import secrets
+import sys
+import time
 from collections import namedtuple
 from qrcode import QRCode
-from urllib.parse import urlencode, quote as urlquote
 
-from aegis.icons import IconGenerator
-from aegis.vault import decrypt_vault, VaultError, VaultGenerator
+from aegis import _json
+from aegis._format import FormatError
+from aegis.agent import AgentClient, AgentError, KeyAgent, SOCKET_ENV
+from aegis.extract import extract_icons
+from aegis.fixtures import write_fake_checkout
+from aegis.icons import IconFilter, IconGenerator, SHAPES
+from aegis.lint import lint_vault
+from aegis.metrics import emit, Metrics
+from aegis.migration import generate_migration_uris
+from aegis.minify import minify_icon
+from aegis.optimize import optimize_entries, OptimizeStats
+from aegis.pack import apply_delta, build_packs, parse_source, verify_pack, PackError, PackReader
+from aegis.qr import contact_sheet, write_images
+from aegis.render import BACKENDS, RenderError
+from aegis.server import IconServer
+from aegis.shard import join_vault, shard_paths, split_vault
+from aegis.uri import entry_to_uri, iter_uri_entries
+from aegis.vault import create_password_slot, decrypt_vault, dump_db, dump_encrypted_vault, dump_vault, iter_projected_entries, slot_id, unwrap_master_key, VaultError, VaultGenerator
+from aegis.workers import RenderStats
 
 def _write_output(output, data):
-    if output != "-":
+    if isinstance(data, bytes):
+        if output != "-":
+            with io.open(output, "wb") as f:
+                f.write(data)
+        else:
+            sys.stdout.buffer.write(data + b"\n")
+            sys.stdout.flush()
+    elif output != "-":
         with io.open(output, "w") as f:
             f.write(data)
     else:
         print(data)
 
+@contextlib.contextmanager
+def _open_output(output, end=b"\n"):
+    """Opens the given output file for writing bytes, or stdout for '-'. When
+    writing to stdout, end is written after everything else."""
+    if output == "-":
+        try:
+            yield sys.stdout.buffer
+            sys.stdout.buffer.write(end)
+        finally:
+            sys.stdout.flush()
+        return
+    with io.open(output, "wb") as f:
+        yield f
+
 def _gen_uri() -> str:
-    entry = VaultGenerator().generate_entry()
-
-    params = {
-        "secret": entry["info"]["secret"],
-        "issuer": entry["issuer"],
-        "algorithm": entry["info"]["algo"],
-        "digits": entry["info"]["digits"],
-        "period": entry["info"]["period"]
+    return entry_to_uri(VaultGenerator().generate_entry())
+
+class _MinifyStats:
+    def __init__(self):
+        self.before = 0
+        self.after = 0
+
+    def minify(self, icon, precision):
+        before = len(icon.get_xml(record=False).encode("utf-8"))
+        icon = minify_icon(icon, precision=precision)
+        xml = icon.get_xml()
+        self.add(icon.filename, before, len(xml.encode("utf-8")))
+        return icon, xml
+
+    def add(self, filename, before, after):
+        self.before += before
+        self.after += after
+        print(f"{filename}: {before} -> {after} bytes (saved {before - after})")
+
+    def print_summary(self):
+        saved = self.before - self.after
+        percent = saved / self.before * 100 if self.before > 0 else 0
+        print(f"minified icons: {self.before} -> {self.after} bytes (saved {saved}, {percent:.1f}%)")
+
+def _icon_filters(args):
+    return {
+        "only": IconFilter.parse(args.only) if args.only else None,
+        "exclude": IconFilter.parse(args.exclude) if args.exclude else None
     }
 
-    uri = "otpauth://totp/{}:{}?".format(urlquote(entry["issuer"]), urlquote(entry["name"]))
-    return uri + urlencode(params)
+def _icon_xml(icon, args, stats):
+    if not args.minify:
+        return icon.get_xml()
+    return stats.minify(icon, args.precision)[1]
+
+def _new_metrics(args):
+    return Metrics() if args.metrics_out is not None else None
+
+def _write_metrics(args, metrics):
+    if metrics is not None:
+        _write_output(args.metrics_out, json.dumps(metrics.summary(), indent=4))
+
+def _variant_output(output, shape, shapes, folder=False):
+    # every variant gets its own output if there's more than one, the shape goes in front of the extension of files
+    if len(shapes) == 1:
+        return output
+    if folder:
+        output = output.rstrip(os.sep + (os.altsep or "")) or output
+        return f"{output}-{shape}"
+    stem, ext = os.path.splitext(output)
+    return f"{stem}-{shape}{ext}"
 
 def _do_icons(args):
-    gen = IconGenerator(path=args.simple_icons)
-    for icon in gen.generate_all():
-        with open(os.path.join(args.output, icon.filename), "w") as f:
-            f.write(icon.get_xml())
+    metrics = _new_metrics(args)
+    gen = IconGenerator(path=args.simple_icons, on_event=metrics)
+    stats = _MinifyStats()
+    for shape in args.variants:
+        os.makedirs(_variant_output(args.output, shape, args.variants, folder=True), exist_ok=True)
+
+    for variants in gen.generate_all_variants(shapes=args.variants, **_icon_filters(args)):
+        for shape, icon in variants.items():
+            xml = _icon_xml(icon, args, stats)
+            start = time.perf_counter()
+            with open(os.path.join(_variant_output(args.output, shape, args.variants, folder=True), icon.filename), "w") as f:
+                f.write(xml)
+            emit(metrics, "write", icon.filename, start, len(xml))
+    if args.minify:
+        stats.print_summary()
+    _write_metrics(args, metrics)
 
 def _do_icon_pack(args):
-    pack = {
-        "uuid": "6a371ea0-1178-4677-ae93-cda7a7a5b378",
-        "name": "Aegis Simple Icons",
-        "version": args.version,
-        "icons": []
-    }
+    sources = [parse_source(spec) for spec in ([args.simple_icons] if args.simple_icons else []) + (args.sources or [])]
+    if len(sources) == 0:
+        print("error: at least one of --simple-icons or --source is required", file=sys.stderr)
+        sys.exit(1)
+    if (args.previous is None) != (args.delta_output is None):
+        print("error: --previous and --delta-output must be used together", file=sys.stderr)
+        sys.exit(1)
+    if args.square and args.variants is not None:
+        print("error: --square and --variants can't be used together", file=sys.stderr)
+        sys.exit(1)
+    shapes = args.variants or (("square",) if args.square else ("circle",))
+    if args.previous is not None and len(shapes) > 1:
+        print("error: --previous can only be used with a single variant", file=sys.stderr)
+        sys.exit(1)
 
-    with zipfile.ZipFile(args.output, "w", zipfile.ZIP_DEFLATED) as zipf:
-        count = 0
-        for icon in IconGenerator(path=args.simple_icons).generate_all(square=args.square):
-            basename = os.path.basename(icon.filename)
-            filename_zip = os.path.join("SVG", basename)
-            zipf.writestr(filename_zip, icon.get_xml())
-            pack["icons"].append({
-                "name": icon.title,
-                "filename": filename_zip,
-                "category": None,
-                "issuer": [icon.title]
-            })
-            count += 1
-        pack["icons"].sort(key=lambda icon: icon["filename"])
-        zipf.writestr("pack.json", json.dumps(pack, indent=4).encode("utf-8"))
-        print(f"generated pack with {count} icons")
+    # open the previous pack first, so that a broken one doesn't waste a whole build
+    previous = None
+    if args.previous is not None:
+        try:
+            previous = PackReader(args.previous)
+        except (PackError, zipfile.BadZipFile) as e:
+            print(f"error: {e}", file=sys.stderr)
+            sys.exit(1)
+
+    metrics = _new_metrics(args)
+    packs = build_packs(
+        sources, args.version, shapes=shapes, precision=args.precision if args.minify else None,
+        workers=args.workers, on_event=metrics, **_icon_filters(args)
+    )
+    for shape, (builder, sizes) in packs.items():
+        output = _variant_output(args.output, shape, shapes)
+        builder.write(output, compact=args.compact, on_event=metrics)
+        print(f"generated {shape} pack {output} with {len(builder.files)} icons ({builder.duplicates} duplicates merged)")
+        if previous is not None:
+            try:
+                with previous:
+                    manifest = builder.write_delta(previous, args.delta_output, compact=args.compact)
+            except (PackError, zipfile.BadZipFile) as e:
+                print(f"error: {e}", file=sys.stderr)
+                sys.exit(1)
+            print("generated delta from version {}: {} added, {} changed, {} removed".format(
+                manifest["base_version"], len(manifest["added"]), len(manifest["changed"]), len(manifest["removed"])
+            ))
+
+        if args.minify:
+            stats = _MinifyStats()
+            for icon in sizes:
+                stats.add(icon.filename, icon.original_size, icon.size)
+            stats.print_summary()
+    _write_metrics(args, metrics)
+
+def _do_apply_icon_pack_delta(args):
+    try:
+        manifest = apply_delta(args.previous, args.delta, args.output)
+    except (PackError, zipfile.BadZipFile) as e:
+        print(f"error: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(f"updated pack from version {manifest['base_version']} to {manifest['version']}")
+
+def _do_verify_icon_pack(args):
+    try:
+        problems = verify_pack(args.input, workers=args.workers)
+    except (PackError, zipfile.BadZipFile) as e:
+        print(f"error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    for filename, problem in problems:
+        print(f"{filename}: {problem}")
+    if len(problems) > 0:
+        print(f"found {len(problems)} problems")
+        sys.exit(1)
+    print("no problems found")
+
+def _do_fake_simple_icons(args):
+    icons = write_fake_checkout(args.output, count=args.count, segments=args.segments, seed=args.seed)
+    print(f"wrote {len(icons)} fake icons to {args.output}")
+
+def _do_serve_icons(args):
+    try:
+        server = IconServer(args.simple_icons, workers=args.workers, cache_size=args.cache_size, render_backend=args.render_backend)
+    except RenderError as e:
+        print(f"error: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(f"serving icons on http://{args.host}:{args.port}/icons/")
+    try:
+        asyncio.run(server.serve_forever(host=args.host, port=args.port))
+    except KeyboardInterrupt:
+        pass
 
 def _do_vault(args):
-    gen = VaultGenerator(simple_icons=args.simple_icons)
-    vault = gen.generate(entry_count=args.entries)
-    _write_output(args.output, json.dumps(vault, indent=4))
+    metrics = _new_metrics(args)
+    try:
+        gen = VaultGenerator(
+            simple_icons=args.simple_icons, icon_format=args.icon_format, icon_size=args.icon_size,
+            render_backend=args.render_backend, on_event=metrics
+        )
+    except RenderError as e:
+        print(f"error: {e}", file=sys.stderr)
+        sys.exit(1)
+    stats = RenderStats()
+    max_rss = args.max_worker_rss * 1024 * 1024 if args.max_worker_rss is not None else None
+    entries = gen.generate_entries(
+        entry_count=args.entries, workers=args.workers, queue_size=args.queue_size,
+        max_renders=args.max_renders, max_rss=max_rss, stats=stats, unique=args.unique
+    )
+    with _open_output(args.output) as f:
+        dump_vault(f, gen.generate_empty(), entries, compact=args.compact, on_event=metrics)
+
+    for (icon,), error in stats.failures:
+        print(f"failed to render icon for {icon['title']}: {error}", file=sys.stderr)
+    # SVG icons are embedded as-is, so there's nothing to report about rendering
+    if stats.renders > 0 and args.icon_format != "svg":
+        print(stats.summary(), file=sys.stderr)
+    _write_metrics(args, metrics)
+
+def _ask_new_password():
+    password = getpass.getpass()
+    if getpass.getpass("Confirm password: ") != password:
+        print("error: the passwords don't match", file=sys.stderr)
+        sys.exit(1)
+    return password
+
+def _do_import_uris(args):
+    master_key = slots = None
+    if args.encrypt:
+        master_key = secrets.token_bytes(32)
+        slots = [create_password_slot(master_key, _ask_new_password())]
+
+    count = errors = 0
+    def report(lineno, e):
+        nonlocal errors
+        errors += 1
+        print(f"line {lineno}: {e}", file=sys.stderr)
+
+    def import_entries(f_in):
+        nonlocal count
+        for entry in iter_uri_entries(f_in, errors=report):
+            count += 1
+            yield entry
+
+    f_in = io.open(args.input, "r") if args.input != "-" else sys.stdin
+    try:
+        with _open_output(args.output) as f_out:
+            empty = VaultGenerator.generate_empty()
+            if master_key is not None:
+                dump_encrypted_vault(f_out, empty["db"], import_entries(f_in), master_key, slots, compact=args.compact)
+            else:
+                dump_vault(f_out, empty, import_entries(f_in), compact=args.compact)
+    finally:
+        if args.input != "-":
+            f_in.close()
+
+    print(f"imported {count} entries, {errors} lines skipped", file=sys.stderr)
+
+def _decrypt(args, data, safe=True):
+    """Decrypts the given vault with a master key from the key agent, or by
+    asking for the password. Returns the database and the master key."""
+    client = None
+    if args.agent:
+        try:
+            client = AgentClient(args.agent_socket)
+        except AgentError as e:
+            print(f"not using the key agent: {e}", file=sys.stderr)
+
+    try:
+        if client is not None:
+            try:
+                res = client.get_key(slot_id(slot) for slot in data["header"]["slots"] if slot["type"] == 1)
+            except AgentError as e:
+                print(f"not using the key agent: {e}", file=sys.stderr)
+                client.close()
+                client = res = None
+            if res is not None:
+                try:
+                    return decrypt_vault(data, safe=safe, master_key=res[1]), res[1]
+                except VaultError:
+                    pass
+
+        # ask the user for a password
+        password = getpass.getpass()
+
+        slot, master_key = unwrap_master_key(data["header"], password, safe=safe)
+        db = decrypt_vault(data, safe=safe, master_key=master_key)
+        if client is not None:
+            try:
+                client.add_key(slot_id(slot), master_key)
+            except AgentError as e:
+                print(f"unable to add the key to the key agent: {e}", file=sys.stderr)
+        return db, master_key
+    finally:
+        if client is not None:
+            client.close()
 
 def _do_decrypt(args):
     with io.open(args.input, "r") as f:
         data = json.load(f)
 
-    # ask the user for a password
-    password = getpass.getpass()
+    db = _decrypt(args, data, safe=not args.unsafe)[0]
 
-    db = decrypt_vault(data, password, safe=not args.unsafe)
+    if args.fields is not None or args.drop_icons or args.format == "jsonl":
+        try:
+            _write_projected_db(args, db)
+        except FormatError as e:
+            print(f"error: {e}", file=sys.stderr)
+            sys.exit(1)
+        return
+
+    if args.compact:
+        db = _json.dumps(_json.loads(db), compact=True)
     _write_output(args.output, db)
 
+def _write_projected_db(args, db):
+    fields = [field.strip() for field in args.fields.split(",")] if args.fields is not None else None
+    skeleton = []
+    entries = iter_projected_entries(db, fields=fields, drop_icons=args.drop_icons, skeleton=skeleton)
+
+    with _open_output(args.output, end=b"" if args.format == "jsonl" else b"\n") as f_out:
+        if args.format == "jsonl":
+            for entry in entries:
+                f_out.write(_json.dumps(entry, compact=True) + b"\n")
+        else:
+            # the projected entries are small, but the rest of the database is only known after them
+            entries = list(entries)
+            dump_db(f_out, skeleton[0], entries, compact=args.compact)
+
+def _do_agent(args):
+    agent = KeyAgent(args.socket, ttl=args.ttl)
+    print(f"{SOCKET_ENV}={agent.path}; export {SOCKET_ENV};", flush=True)
+    try:
+        asyncio.run(agent.serve_forever())
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+
+def _do_optimize_vault(args):
+    with io.open(args.input, "rb") as f:
+        data = _json.loads(f.read())
+
+    # the vault is encrypted if the database is a base64 string instead of an object
+    master_key = None
+    if isinstance(data["db"], str):
+        db, master_key = _decrypt(args, data)
+        db = _json.loads(db)
+    else:
+        db = data["db"]
+
+    stats = OptimizeStats()
+    entries = optimize_entries(
+        db["entries"], size=args.icon_size, fmt=args.icon_format,
+        quality=args.quality, workers=args.workers, stats=stats
+    )
+    with _open_output(args.output) as f_out:
+        if master_key is not None:
+            dump_encrypted_vault(f_out, db, entries, master_key, data["header"]["slots"], compact=args.compact)
+        else:
+            dump_vault(f_out, data, entries, compact=args.compact)
+
+    print(stats, file=sys.stderr)
+    if args.output != "-":
+        before, after = os.path.getsize(args.input), os.path.getsize(args.output)
+        print(f"vault: {before} -> {after} bytes (saved {before - after})", file=sys.stderr)
+
+def _do_split_vault(args):
+    with io.open(args.input, "rb") as f:
+        data = _json.loads(f.read())
+    # the input is either a plain vault or just its database
+    db = data["db"] if isinstance(data.get("db"), dict) else data
+    if "entries" not in db:
+        print("error: the input is not a plain vault or vault database", file=sys.stderr)
+        sys.exit(1)
+
+    password = _ask_new_password()
+    os.makedirs(args.output, exist_ok=True)
+    start = time.perf_counter()
+    shards = split_vault(db, args.output, args.shards, password, workers=args.workers, compact=args.compact)
+    elapsed = time.perf_counter() - start
+
+    total = sum(size for path, count, size in shards)
+    print(f"wrote {len(db['entries'])} entries to {len(shards)} shards in {elapsed:.1f}s ({total / elapsed / 1024 / 1024:.1f} MiB/s)")
+
+def _do_join_vault(args):
+    paths = []
+    for path in args.inputs:
+        paths.extend(shard_paths(path) if os.path.isdir(path) else [path])
+
+    password = getpass.getpass()
+    master_key = slots = None
+    if args.encrypt:
+        master_key = secrets.token_bytes(32)
+        slots = [create_password_slot(master_key, _ask_new_password())]
+
+    count = 0
+    def counted(entries):
+        nonlocal count
+        for entry in entries:
+            count += 1
+            yield entry
+
+    start = time.perf_counter()
+    try:
+        db, entries = join_vault(paths, password, workers=args.workers)
+        with _open_output(args.output) as f_out:
+            if master_key is not None:
+                dump_encrypted_vault(f_out, db, counted(entries), master_key, slots, compact=args.compact)
+            else:
+                dump_vault(f_out, dict(VaultGenerator.generate_empty(), db=db), counted(entries), compact=args.compact)
+    except (FormatError, ValueError, VaultError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    elapsed = time.perf_counter() - start
+    print(f"joined {count} entries from {len(paths)} shards in {elapsed:.1f}s", file=sys.stderr)
+
+def _do_lint(args):
+    count = 0
+    def report(index, problem):
+        nonlocal count
+        count += 1
+        if args.max_problems is None or count <= args.max_problems:
+            print(f"entry {index}: {problem}")
+
+    try:
+        if args.input != "-":
+            with io.open(args.input, "rb") as f:
+                summary = lint_vault(f, workers=args.workers, report=report)
+        else:
+            summary = lint_vault(sys.stdin.buffer, workers=args.workers, report=report)
+    except FormatError as e:
+        print(f"error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    print(summary)
+    if summary.problems > 0:
+        sys.exit(1)
+
+def _do_extract_icons(args):
+    count = 0
+    def report(index, problem):
+        nonlocal count
+        count += 1
+        if args.max_problems is None or count <= args.max_problems:
+            print(f"entry {index}: {problem}", file=sys.stderr)
+
+    os.makedirs(args.output, exist_ok=True)
+    try:
+        if args.input != "-":
+            with io.open(args.input, "rb") as f:
+                summary, mapping = extract_icons(f, args.output, workers=args.workers, report=report)
+        else:
+            summary, mapping = extract_icons(sys.stdin.buffer, args.output, workers=args.workers, report=report)
+    except FormatError as e:
+        print(f"error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    mapping_path = args.mapping or os.path.join(args.output, "icons.json")
+    _write_output(mapping_path, _json.dumps(mapping, compact=args.compact))
+    print(summary)
+
 def _do_qr(args):
-    uri = _gen_uri()
+    if args.output is None and args.sheet is None:
+        uri = _gen_uri()
+
+        qr = QRCode()
+        qr.add_data(uri)
+        qr.print_ascii(invert=True)
+        return
+
+    if args.input is not None:
+        with io.open(args.input, "r") as f:
+            uris = [line.strip() for line in f if line.strip()]
+    else:
+        uris = [_gen_uri() for i in range(args.count)]
+
+    start = time.perf_counter()
+    if args.output is not None:
+        os.makedirs(args.output, exist_ok=True)
+        filenames = write_images(uris, args.output, fmt=args.format, scale=args.scale, mask_pattern=args.mask_pattern, workers=args.workers)
+        with io.open(os.path.join(args.output, "uris.txt"), "w") as f:
+            for filename, uri in zip(filenames, uris):
+                f.write(f"{filename}\t{uri}\n")
+    if args.sheet is not None:
+        sheet = contact_sheet(uris, scale=args.scale, mask_pattern=args.mask_pattern, columns=args.columns, workers=args.workers)
+        sheet.save(args.sheet)
+
+    elapsed = time.perf_counter() - start
+    print(f"generated {len(uris)} QR codes in {elapsed:.2f}s ({len(uris) / elapsed:.1f}/s)")
+
+def _do_migration(args):
+    gen = VaultGenerator()
+    def report(entry, e):
+        print(f"skipped {entry['issuer']} ({entry['name']}): {e}", file=sys.stderr)
+
+    # every batch of entries is a separate migration batch with its own id
+    uris = []
+    remaining = args.entries
+    while remaining > 0:
+        count = min(remaining, args.batch_entries or remaining)
+        entries = gen.generate_entries(entry_count=count)
+        uris.extend(generate_migration_uris(entries, max_uri_length=args.max_length, errors=report))
+        remaining -= count
 
-    qr = QRCode()
-    qr.add_data(uri)
-    qr.print_ascii(invert=True)
+    if args.qr_output is not None:
+        os.makedirs(args.qr_output, exist_ok=True)
+        write_images(uris, args.qr_output, fmt=args.format, mask_pattern=args.mask_pattern, workers=args.workers)
+    if args.qr_sheet is not None:
+        sheet = contact_sheet(uris, mask_pattern=args.mask_pattern, workers=args.workers)
+        sheet.save(args.qr_sheet)
+    if args.output is not None:
+        _write_output(args.output, "\n".join(uris))
+    print(f"generated {len(uris)} migration payloads for {args.entries} entries", file=sys.stderr)
 
 def _do_uri(args):
     uri = _gen_uri()
     print(uri)
 
+def _add_minify_args(parser):
+    parser.add_argument("--minify", dest="minify", action="store_true", help="minify the SVG output and report the bytes saved")
+    parser.add_argument("--precision", dest="precision", default=3, type=int, help="amount of decimals to keep for numbers in minified path data")
+
+def _icon_filter_spec(value):
+    # parse the spec once up front, so that unknown prefixes and unreadable files are usage errors
+    try:
+        IconFilter.parse([value])
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    except OSError as e:
+        raise argparse.ArgumentTypeError(f"unable to read {e.filename}: {e.strerror}")
+    return value
+
+def _add_filter_args(parser):
+    spec_help = "'slug:<slug>', 'title:<glob>', 'hex:<glob>' or 'file:<path to list of slugs>'; a bare value is a slug"
+    parser.add_argument("--only", dest="only", action="append", type=_icon_filter_spec, help=f"only generate icons that match this filter (can be repeated): {spec_help}")
+    parser.add_argument("--exclude", dest="exclude", action="append", type=_icon_filter_spec, help=f"skip icons that match this filter (can be repeated): {spec_help}")
+
+def _variants(value):
+    shapes = tuple(dict.fromkeys(shape.strip() for shape in value.split(",")))
+    for shape in shapes:
+        if shape not in SHAPES:
+            raise argparse.ArgumentTypeError(f"unsupported shape: {shape}")
+    return shapes
+
+def _add_variants_arg(parser, default):
+    parser.add_argument("--variants", dest="variants", default=default, type=_variants, help=f"comma-separated list of shapes to generate ({', '.join(SHAPES)}), every SVG file is only parsed once for all of them; with more than one, every shape gets its own output with the shape appended to its name")
+
+def _add_render_backend_arg(parser):
+    parser.add_argument("--render-backend", dest="render_backend", default="auto", choices=["auto"] + list(BACKENDS), help="the backend to render PNG icons with ('auto' picks the cheapest in-process one that is installed)")
+
+def _add_compact_arg(parser):
+    parser.add_argument("--compact", dest="compact", action="store_true", help="write JSON without indentation (uses orjson if it's installed)")
+
+def _add_agent_args(parser):
+    parser.add_argument("--agent", dest="agent", action="store_true", help="fetch the master key from the key agent and store it there after a successful decryption")
+    parser.add_argument("--agent-socket", dest="agent_socket", help=f"socket of the key agent (defaults to ${SOCKET_ENV})")
+
+def _add_metrics_arg(parser):
+    parser.add_argument("--metrics-out", dest="metrics_out", default=None, help="write a JSON summary of the timings of every stage to this file ('-' for stdout)")
+
 def main():
     parser = argparse.ArgumentParser(description="A collection of developer tools for Aegis Authenticator", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     subparsers = parser.add_subparsers()
@@ -97,33 +595,163 @@ def main():
     icon_parser = subparsers.add_parser("gen-icons", help="Generate icons for Aegis based on simple-icons", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     icon_parser.add_argument("--simple-icons", dest="simple_icons", required=True, help="path of the simple-icons repository checkout")
     icon_parser.add_argument("--output", dest="output", required=True, help="icon output folder")
+    _add_variants_arg(icon_parser, ("circle",))
+    _add_minify_args(icon_parser)
+    _add_filter_args(icon_parser)
+    _add_metrics_arg(icon_parser)
     icon_parser.set_defaults(func=_do_icons)
 
     icon_pack_parser = subparsers.add_parser("gen-icon-pack", help="Generate an icon pack for Aegis based on simple-icons", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
-    icon_pack_parser.add_argument("--simple-icons", dest="simple_icons", required=True, help="path of the simple-icons repository checkout")
+    icon_pack_parser.add_argument("--simple-icons", dest="simple_icons", help="path of the simple-icons repository checkout")
+    icon_pack_parser.add_argument("--source", dest="sources", action="append", help="path of an additional checkout in the simple-icons layout, optionally followed by '=<path of its metadata file>' (can be repeated)")
+    icon_pack_parser.add_argument("--workers", dest="workers", default=None, type=int, help="the amount of sources to process in parallel (defaults to the amount of CPUs)")
     icon_pack_parser.add_argument("--version", dest="version", required=True, type=int, help="the version number")
     icon_pack_parser.add_argument("--output", dest="output", required=True, help="icon pack output filename")
     icon_pack_parser.add_argument("--square", dest="square", action="store_true", help="output square icons (instead of circular)")
+    _add_variants_arg(icon_pack_parser, None)
+    icon_pack_parser.add_argument("--previous", dest="previous", help="previous version of the pack to generate a delta archive against")
+    icon_pack_parser.add_argument("--delta-output", dest="delta_output", help="delta archive output filename")
+    _add_minify_args(icon_pack_parser)
+    _add_filter_args(icon_pack_parser)
+    _add_compact_arg(icon_pack_parser)
+    _add_metrics_arg(icon_pack_parser)
     icon_pack_parser.set_defaults(func=_do_icon_pack)
 
+    apply_delta_parser = subparsers.add_parser("apply-icon-pack-delta", help="Apply a delta archive to an icon pack", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    apply_delta_parser.add_argument("--previous", dest="previous", required=True, help="the version of the pack the delta applies to")
+    apply_delta_parser.add_argument("--delta", dest="delta", required=True, help="delta archive filename")
+    apply_delta_parser.add_argument("--output", dest="output", required=True, help="updated icon pack output filename")
+    apply_delta_parser.set_defaults(func=_do_apply_icon_pack_delta)
+
+    verify_pack_parser = subparsers.add_parser("verify-icon-pack", help="Check that an icon pack is well formed", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    verify_pack_parser.add_argument("--input", dest="input", required=True, help="icon pack filename")
+    verify_pack_parser.add_argument("--workers", dest="workers", default=None, type=int, help="the amount of worker processes (defaults to the amount of CPUs)")
+    verify_pack_parser.set_defaults(func=_do_verify_icon_pack)
+
+    fake_icons_parser = subparsers.add_parser("gen-fake-simple-icons", help="Generate a fake simple-icons checkout with random icons for benchmarking", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    fake_icons_parser.add_argument("--output", dest="output", required=True, help="checkout output folder")
+    fake_icons_parser.add_argument("--count", dest="count", default=3000, type=int, help="the amount of icons to generate")
+    fake_icons_parser.add_argument("--segments", dest="segments", default=40, type=int, help="the average amount of path segments per icon")
+    fake_icons_parser.add_argument("--seed", dest="seed", default=None, type=int, help="seed for the random generator, to get the same checkout every time")
+    fake_icons_parser.set_defaults(func=_do_fake_simple_icons)
+
+    serve_parser = subparsers.add_parser("serve-icons", help="Serve icons based on simple-icons over HTTP", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    serve_parser.add_argument("--simple-icons", dest="simple_icons", required=True, help="path of the simple-icons repository checkout")
+    serve_parser.add_argument("--host", dest="host", default="127.0.0.1", help="the address to listen on")
+    serve_parser.add_argument("--port", dest="port", default=8080, type=int, help="the port to listen on")
+    serve_parser.add_argument("--workers", dest="workers", default=None, type=int, help="the amount of render worker processes (defaults to the amount of CPUs)")
+    serve_parser.add_argument("--cache-size", dest="cache_size", default=1024, type=int, help="the maximum amount of rendered icons to keep in memory")
+    _add_render_backend_arg(serve_parser)
+    serve_parser.set_defaults(func=_do_serve_icons)
+
     vault_parser = subparsers.add_parser("gen-vault", help="Generate a random vault for use in the Aegis app", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     vault_parser.add_argument("--output", dest="output", default="-", help="vault output file ('-' for stdout)")
     vault_parser.add_argument("--entries", dest="entries", default=20, type=int, help="the amount of entries to generate")
     vault_parser.add_argument("--simple-icons", dest="simple_icons", help="path of the simple-icons repository checkout")
+    vault_parser.add_argument("--unique", dest="unique", action="store_true", help="don't generate any entries with the same issuer and name")
+    vault_parser.add_argument("--icon-format", dest="icon_format", default="png", choices=["png", "svg"], help="format of the embedded icons (SVG skips rasterization)")
+    vault_parser.add_argument("--icon-size", dest="icon_size", default=800, type=int, help="width and height of rendered PNG icons")
+    _add_render_backend_arg(vault_parser)
+    vault_parser.add_argument("--workers", dest="workers", default=None, type=int, help="the amount of icon render worker processes (defaults to the amount of CPUs)")
+    vault_parser.add_argument("--queue-size", dest="queue_size", default=None, type=int, help="the maximum amount of entries waiting for their icon (defaults to 4 per worker)")
+    vault_parser.add_argument("--max-renders", dest="max_renders", default=None, type=int, help="recycle a render worker after this amount of renders")
+    vault_parser.add_argument("--max-worker-rss", dest="max_worker_rss", default=None, type=int, help="recycle a render worker once its RSS exceeds this amount of MiB")
+    _add_compact_arg(vault_parser)
+    _add_metrics_arg(vault_parser)
     vault_parser.set_defaults(func=_do_vault)
 
     qr_parser = subparsers.add_parser("gen-qr", help="Generate a random QR code", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    qr_parser.add_argument("--output", dest="output", help="write the QR codes as image files to this folder, along with a uris.txt index (instead of printing one to the terminal)")
+    qr_parser.add_argument("--sheet", dest="sheet", help="write the QR codes tiled on a single contact sheet image to this file")
+    qr_parser.add_argument("--count", dest="count", default=1, type=int, help="the amount of random QR codes to generate")
+    qr_parser.add_argument("--input", dest="input", help="file with one URI per line to encode instead of random ones")
+    qr_parser.add_argument("--format", dest="format", default="png", choices=["png", "svg"], help="format of the image files")
+    qr_parser.add_argument("--scale", dest="scale", default=8, type=int, help="the amount of pixels per module")
+    qr_parser.add_argument("--mask-pattern", dest="mask_pattern", default=None, type=int, choices=range(8), help="use this mask pattern instead of searching for the best one, which is much faster")
+    qr_parser.add_argument("--columns", dest="columns", default=None, type=int, help="the amount of columns of the contact sheet (defaults to a square)")
+    qr_parser.add_argument("--workers", dest="workers", default=None, type=int, help="the amount of worker processes (defaults to the amount of CPUs)")
     qr_parser.set_defaults(func=_do_qr)
 
+    migration_parser = subparsers.add_parser("gen-migration", help="Generate random otpauth-migration payloads", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    migration_parser.add_argument("--entries", dest="entries", default=100, type=int, help="the amount of entries to generate")
+    migration_parser.add_argument("--batch-entries", dest="batch_entries", default=None, type=int, help="the maximum amount of entries per migration batch (defaults to a single batch)")
+    migration_parser.add_argument("--max-length", dest="max_length", default=1024, type=int, help="the maximum length of every URI")
+    migration_parser.add_argument("--output", dest="output", default="-", help="URI output file, one per line ('-' for stdout)")
+    migration_parser.add_argument("--qr-output", dest="qr_output", help="also write the URIs as QR code image files to this folder")
+    migration_parser.add_argument("--qr-sheet", dest="qr_sheet", help="also write the URIs as QR codes tiled on a single contact sheet image to this file")
+    migration_parser.add_argument("--format", dest="format", default="png", choices=["png", "svg"], help="format of the QR code image files")
+    migration_parser.add_argument("--mask-pattern", dest="mask_pattern", default=None, type=int, choices=range(8), help="use this QR mask pattern instead of searching for the best one, which is much faster")
+    migration_parser.add_argument("--workers", dest="workers", default=None, type=int, help="the amount of QR code worker processes (defaults to the amount of CPUs)")
+    migration_parser.set_defaults(func=_do_migration)
+
     uri_parser = subparsers.add_parser("gen-uri", help="Generate a random URI", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     uri_parser.set_defaults(func=_do_uri)
 
+    import_parser = subparsers.add_parser("import-uris", help="Import otpauth URIs into a new vault", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    import_parser.add_argument("--input", dest="input", default="-", help="file with one otpauth URI per line ('-' for stdin)")
+    import_parser.add_argument("--output", dest="output", default="-", help="vault output file ('-' for stdout)")
+    import_parser.add_argument("--encrypt", dest="encrypt", action="store_true", help="encrypt the vault with a password")
+    _add_compact_arg(import_parser)
+    import_parser.set_defaults(func=_do_import_uris)
+
     decrypt_parser = subparsers.add_parser("decrypt-vault", help="Decrypt an Aegis vault", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     decrypt_parser.add_argument("--input", dest="input", required=True, help="encrypted Aegis vault file")
     decrypt_parser.add_argument("--output", dest="output", default="-", help="output file ('-' for stdout)")
     decrypt_parser.add_argument("--unsafe", dest="unsafe", action="store_true", help="skip authentication tag verification")
+    decrypt_parser.add_argument("--fields", dest="fields", help="comma-separated list of entry fields to output, nested fields are separated by dots (e.g. issuer,name,info.secret)")
+    decrypt_parser.add_argument("--drop-icons", dest="drop_icons", action="store_true", help="leave out the icons of the entries")
+    decrypt_parser.add_argument("--format", dest="format", default="json", choices=["json", "jsonl"], help="output the database as JSON or only its entries as JSON Lines")
+    _add_agent_args(decrypt_parser)
+    _add_compact_arg(decrypt_parser)
     decrypt_parser.set_defaults(func=_do_decrypt)
 
+    agent_parser = subparsers.add_parser("key-agent", help="Keep vault master keys in memory for decrypt-vault --agent", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    agent_parser.add_argument("--socket", dest="socket", help="path of the Unix socket to listen on (defaults to a new private temporary directory)")
+    agent_parser.add_argument("--ttl", dest="ttl", default=15 * 60, type=int, help="the amount of seconds to keep a master key around")
+    agent_parser.set_defaults(func=_do_agent)
+
+    split_parser = subparsers.add_parser("split-vault", help="Split a plain Aegis vault into encrypted shards", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    split_parser.add_argument("--input", dest="input", required=True, help="plain Aegis vault or database file")
+    split_parser.add_argument("--output", dest="output", required=True, help="shard output folder")
+    split_parser.add_argument("--shards", dest="shards", default=8, type=int, help="the amount of shards")
+    split_parser.add_argument("--workers", dest="workers", default=None, type=int, help="the amount of shards to encrypt in parallel (defaults to the amount of CPUs)")
+    _add_compact_arg(split_parser)
+    split_parser.set_defaults(func=_do_split_vault)
+
+    join_parser = subparsers.add_parser("join-vault", help="Join encrypted Aegis vault shards into a single vault", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    join_parser.add_argument("--input", dest="inputs", required=True, action="append", help="a shard or a folder of shards written by split-vault (can be repeated)")
+    join_parser.add_argument("--output", dest="output", default="-", help="vault output file ('-' for stdout)")
+    join_parser.add_argument("--workers", dest="workers", default=None, type=int, help="the amount of shards to decrypt in parallel (defaults to the amount of CPUs)")
+    join_parser.add_argument("--encrypt", dest="encrypt", action="store_true", help="encrypt the joined vault with a new password")
+    _add_compact_arg(join_parser)
+    join_parser.set_defaults(func=_do_join_vault)
+
+    optimize_parser = subparsers.add_parser("optimize-vault", help="Shrink the icons of an Aegis vault", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    optimize_parser.add_argument("--input", dest="input", required=True, help="plain or encrypted Aegis vault file")
+    optimize_parser.add_argument("--output", dest="output", default="-", help="vault output file ('-' for stdout), encrypted with the same password if the input is")
+    optimize_parser.add_argument("--icon-size", dest="icon_size", default=256, type=int, help="downscale raster icons larger than this width or height")
+    optimize_parser.add_argument("--icon-format", dest="icon_format", default="png", choices=["png", "webp"], help="format to recompress raster icons as (SVG icons are minified instead)")
+    optimize_parser.add_argument("--quality", dest="quality", default=90, type=int, help="quality of WebP icons")
+    optimize_parser.add_argument("--workers", dest="workers", default=None, type=int, help="the amount of worker processes (defaults to the amount of CPUs)")
+    _add_agent_args(optimize_parser)
+    _add_compact_arg(optimize_parser)
+    optimize_parser.set_defaults(func=_do_optimize_vault)
+
+    extract_parser = subparsers.add_parser("extract-icons", help="Extract the icons of a plain Aegis vault or vault database", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    extract_parser.add_argument("--input", dest="input", required=True, help="plain Aegis vault or database file ('-' for stdin)")
+    extract_parser.add_argument("--output", dest="output", required=True, help="icon output folder")
+    extract_parser.add_argument("--mapping", dest="mapping", help="file to write the icon filename of every entry to (defaults to icons.json in the output folder)")
+    extract_parser.add_argument("--workers", dest="workers", default=None, type=int, help="the amount of worker processes (defaults to the amount of CPUs)")
+    extract_parser.add_argument("--max-problems", dest="max_problems", default=100, type=int, help="the maximum amount of problems to print")
+    _add_compact_arg(extract_parser)
+    extract_parser.set_defaults(func=_do_extract_icons)
+
+    lint_parser = subparsers.add_parser("lint-vault", help="Check that a plain Aegis vault or vault database is well formed", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    lint_parser.add_argument("--input", dest="input", required=True, help="plain Aegis vault or database file ('-' for stdin)")
+    lint_parser.add_argument("--workers", dest="workers", default=None, type=int, help="the amount of worker processes (defaults to the amount of CPUs)")
+    lint_parser.add_argument("--max-problems", dest="max_problems", default=100, type=int, help="the maximum amount of problems to print")
+    lint_parser.set_defaults(func=_do_lint)
+
     args = parser.parse_args()
     if args.func:
         args.func(args)
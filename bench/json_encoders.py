@@ -0,0 +1,51 @@
+# Compares the available JSON encoders on large generated vaults.
+#
+# usage: python bench/json_encoders.py [--entries N] [--icon-size BYTES]
+import argparse
+import os
+import secrets
+import sys
+import time
+from base64 import b64encode
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from aegis import _json
+from aegis.vault import VaultGenerator
+
+def _gen_vault(entries, icon_size):
+    vault = VaultGenerator().generate(entry_count=entries)
+    if icon_size > 0:
+        # random bytes stand in for rendered icons, which is enough to measure encoding speed
+        for entry in vault["db"]["entries"]:
+            entry["icon"] = b64encode(secrets.token_bytes(icon_size)).decode("utf-8")
+            entry["icon_mime"] = "image/png"
+    return vault
+
+def _bench(vault, backend, compact, rounds):
+    best = None
+    for i in range(rounds):
+        start = time.perf_counter()
+        data = _json.dumps(vault, compact=compact, backend=backend)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(data)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the JSON encoders on large vaults")
+    parser.add_argument("--entries", dest="entries", default=100000, type=int, help="the amount of entries to generate")
+    parser.add_argument("--icon-size", dest="icon_size", default=0, type=int, help="the size of the fake icon of every entry in bytes")
+    parser.add_argument("--rounds", dest="rounds", default=3, type=int, help="the amount of rounds to run for every encoder")
+    args = parser.parse_args()
+
+    vault = _gen_vault(args.entries, args.icon_size)
+    print(f"{'backend':<8} {'mode':<8} {'time (s)':>10} {'size (MB)':>10} {'MB/s':>10}")
+    for backend in _json.backends():
+        for compact in (False, True):
+            elapsed, size = _bench(vault, backend, compact, args.rounds)
+            mode = "compact" if compact else "indent"
+            mb = size / 1024 / 1024
+            print(f"{backend:<8} {mode:<8} {elapsed:>10.3f} {mb:>10.1f} {mb / elapsed:>10.1f}")
+
+if __name__ == "__main__":
+    main()
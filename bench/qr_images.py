@@ -0,0 +1,41 @@
+# Measures how many QR code images per second can be generated.
+#
+# usage: python bench/qr_images.py [--count N] [--workers N]
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from aegis.qr import contact_sheet, write_images
+from aegis_tools import _gen_uri
+
+def _bench(name, count, func):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<24} {elapsed:>10.3f} {count / elapsed:>12.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark batch QR code image generation")
+    parser.add_argument("--count", dest="count", default=1000, type=int, help="the amount of QR codes to generate")
+    parser.add_argument("--workers", dest="workers", default=None, type=int, help="the amount of worker processes (defaults to the amount of CPUs)")
+    args = parser.parse_args()
+
+    uris = [_gen_uri() for i in range(args.count)]
+    print(f"{'mode':<24} {'time (s)':>10} {'images/s':>12}")
+    with tempfile.TemporaryDirectory() as output:
+        for mask_pattern in (None, 0):
+            suffix = "" if mask_pattern is None else ", fixed mask"
+            for fmt in ("png", "svg"):
+                _bench(f"{fmt}{suffix}", args.count, lambda: write_images(
+                    uris, output, fmt=fmt, mask_pattern=mask_pattern, workers=args.workers
+                ))
+            _bench(f"sheet{suffix}", args.count, lambda: contact_sheet(
+                uris, mask_pattern=mask_pattern, workers=args.workers
+            ).save(os.path.join(output, "sheet.png")))
+
+if __name__ == "__main__":
+    main()
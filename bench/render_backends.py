@@ -0,0 +1,64 @@
+# Compares the speed and output of the installed PNG render backends.
+#
+# usage: python bench/render_backends.py [--simple-icons PATH] [--count N] [--size PX]
+import argparse
+import io
+import itertools
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from PIL import Image, ImageChops, ImageStat
+
+from aegis.fixtures import write_fake_checkout
+from aegis.icons import IconGenerator
+from aegis.render import available_backends, get_backend, DEFAULT_BACKEND
+
+def _diff(png, reference):
+    # the mean and maximum absolute difference per channel, from 0 to 255
+    img = Image.open(io.BytesIO(png)).convert("RGBA")
+    ref = Image.open(io.BytesIO(reference)).convert("RGBA")
+    if img.size != ref.size:
+        img = img.resize(ref.size)
+    diff = ImageChops.difference(img, ref)
+    stat = ImageStat.Stat(diff)
+    return sum(stat.mean) / len(stat.mean), max(hi for lo, hi in stat.extrema)
+
+def _bench(path, count, size):
+    icons = list(itertools.islice(IconGenerator(path).generate_all(), count))
+    print(f"{len(icons)} icons at {size}x{size}")
+    print(f"{'backend':<16} {'time (s)':>10} {'icons/s':>10} {'mean diff':>10} {'max diff':>10}")
+
+    reference = None
+    for name in [DEFAULT_BACKEND] + [name for name in available_backends() if name != DEFAULT_BACKEND]:
+        backend = get_backend(name)
+        start = time.perf_counter()
+        pngs = [icon.render_png(width=size, height=size, backend=backend) for icon in icons]
+        elapsed = time.perf_counter() - start
+
+        if reference is None:
+            reference = pngs
+        diffs = [_diff(png, ref) for png, ref in zip(pngs, reference)]
+        mean = sum(d[0] for d in diffs) / max(1, len(diffs))
+        worst = max((d[1] for d in diffs), default=0)
+        print(f"{name:<16} {elapsed:>10.3f} {len(icons) / elapsed:>10.1f} {mean:>10.2f} {worst:>10}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the PNG render backends against the default one")
+    parser.add_argument("--simple-icons", dest="simple_icons", help="path of the simple-icons repository checkout (defaults to a fake one)")
+    parser.add_argument("--count", dest="count", default=200, type=int, help="the maximum amount of icons to render")
+    parser.add_argument("--size", dest="size", default=800, type=int, help="width and height of the rendered icons")
+    args = parser.parse_args()
+
+    if args.simple_icons is not None:
+        _bench(args.simple_icons, args.count, args.size)
+        return
+    with tempfile.TemporaryDirectory() as path:
+        write_fake_checkout(path, count=args.count, seed=1)
+        _bench(path, args.count, args.size)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+# Compares generating icons through the xmltodict tree with the template fast
+# path, and checks that both give the same XML.
+#
+# usage: python bench/svg_emitter.py [--simple-icons PATH] [--count N] [--rounds N]
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from aegis.fixtures import write_fake_checkout
+from aegis.icons import IconGenerator, SHAPES
+
+def _generate(gen, shapes):
+    return [icon.get_xml() for variants in gen.generate_all_variants(shapes=shapes) for icon in variants.values()]
+
+def _bench(path, rounds):
+    print(f"{'mode':<24} {'time (s)':>10} {'icons/s':>10}")
+    results = {}
+    for shapes in (("circle",), SHAPES):
+        for fast in (False, True):
+            gen = IconGenerator(path, fast=fast)
+            best = None
+            for i in range(rounds):
+                start = time.perf_counter()
+                xml = _generate(gen, shapes)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            results[(shapes, fast)] = xml
+            name = "{}, {}".format("template" if fast else "xmltodict", "+".join(shapes))
+            print(f"{name:<24} {best:>10.3f} {len(xml) / best:>10.1f}")
+
+    mismatches = sum(
+        1 for shapes in (("circle",), SHAPES)
+        for a, b in zip(results[(shapes, False)], results[(shapes, True)]) if a != b
+    )
+    print(f"{mismatches} icons with different output")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the template SVG emitter against xmltodict")
+    parser.add_argument("--simple-icons", dest="simple_icons", help="path of the simple-icons repository checkout (defaults to a fake one)")
+    parser.add_argument("--count", dest="count", default=3000, type=int, help="the amount of icons of the fake checkout")
+    parser.add_argument("--rounds", dest="rounds", default=3, type=int, help="the amount of rounds to take the best time of")
+    args = parser.parse_args()
+
+    if args.simple_icons is not None:
+        _bench(args.simple_icons, args.rounds)
+        return
+    with tempfile.TemporaryDirectory() as path:
+        write_fake_checkout(path, count=args.count, seed=1)
+        _bench(path, args.rounds)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# Measures exporting entries as otpauth URIs and importing them again, and
+# checks that every entry survives the round trip, including the issuers of
+# the bundled data with colons and ampersands in them.
+#
+# usage: python bench/uri_roundtrip.py [--count N]
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from aegis._data import issuers
+from aegis.uri import entry_to_uri, parse_uri
+from aegis.vault import VaultGenerator
+
+_FIELDS = ("type", "name", "issuer", "info")
+
+def _entries(count):
+    gen = VaultGenerator()
+    # every bundled issuer once, then some labels that need escaping
+    entries = [gen.generate_entry(issuer) for issuer in dict.fromkeys(issuers)]
+    for issuer, name in (("Foo:Bar", "n"), ("a/b", "c:d"), ("100% & more", "x+y?z#"), ("Plain", " padded ")):
+        entries.append(gen.generate_entry(issuer, name))
+    while len(entries) < count:
+        entries.append(gen.generate_entry())
+    return entries
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark and check the otpauth URI round trip")
+    parser.add_argument("--count", dest="count", default=100000, type=int, help="the minimum amount of entries to convert")
+    args = parser.parse_args()
+
+    entries = _entries(args.count)
+    start = time.perf_counter()
+    uris = [entry_to_uri(entry) for entry in entries]
+    export_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    parsed = [parse_uri(uri) for uri in uris]
+    import_time = time.perf_counter() - start
+
+    print(f"{'stage':<10} {'time (s)':>10} {'URIs/s':>10}")
+    print(f"{'export':<10} {export_time:>10.3f} {len(uris) / export_time:>10.1f}")
+    print(f"{'import':<10} {import_time:>10.3f} {len(uris) / import_time:>10.1f}")
+
+    # names and issuers are stripped on import
+    mismatches = [
+        uri for entry, res, uri in zip(entries, parsed, uris)
+        if any(res[key] != (entry[key].strip() if key in ("name", "issuer") else entry[key]) for key in _FIELDS)
+    ]
+    for uri in mismatches[:10]:
+        print(f"mismatch: {uri}")
+    print(f"{len(mismatches)} entries changed by the round trip")
+    if len(mismatches) > 0:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
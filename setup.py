@@ -14,11 +14,16 @@ setup(
     install_requires=[
         "cryptography",
         "lxml",
+        "pillow",
         "qrcode",
         "reportlab",
         "svglib>=0.9.0",
-        "xmltodict"
+        "xmltodict>=0.13.0"
     ],
+    extras_require={
+        "fast": ["orjson"],
+        "cairo": ["cairosvg"]
+    },
     entry_points={
         "console_scripts": [
             "aegis-tools=aegis_tools:main",